@@ -11,10 +11,12 @@ import os
 import time
 import threading
 import xlwings as xw
-import openpyxl
-from openpyxl import load_workbook
+from openpyxl.cell import WriteOnlyCell
 from datetime import datetime
-from excel_utils import ExcelUtils, DATE_FORMATS
+from excel_utils import ExcelUtils, DateParser, DATE_FORMATS
+from group_aggregator import GroupAggregator, AGGREGATIONS
+
+BODY_STYLE_NAME = "日期分类正文"  # 快速模式输出数据区域共用的命名样式
 
 
 class DateFilterTool:
@@ -34,6 +36,8 @@ class DateFilterTool:
         self.processing = False
         self.output_file_path = None
         self.xl_app = None
+        self.date_parser = DateParser()  # 两种模式共用，相同的日期文本跨次运行也只解析一次
+        self.merge_aggregations = {}  # 快速模式合并重复行时的列聚合方式：列名 -> 聚合方式
         
         # 创建主界面
         self.create_main_interface()
@@ -119,6 +123,39 @@ class DateFilterTool:
         # 是否保留原表
         self.keep_original = tk.BooleanVar(value=True)
         ttk.Checkbutton(options_frame, text="保留原工作表", variable=self.keep_original).pack(anchor=tk.W)
+        
+        # 合并重复行时的列聚合方式（快速模式）：设置了聚合方式的列不参与判断重复
+        merge_frame = tk.Frame(options_frame)
+        merge_frame.pack(fill=tk.X, pady=(10, 0))
+        
+        tk.Label(merge_frame, text="合并列:", font=("微软雅黑", 10)).pack(side=tk.LEFT)
+        self.merge_column_combo = ttk.Combobox(merge_frame, font=("微软雅黑", 10), state="readonly", width=16)
+        self.merge_column_combo.pack(side=tk.LEFT, padx=(10, 0))
+        self.aggregation_combo = ttk.Combobox(merge_frame, values=list(AGGREGATIONS.values()),
+                                              font=("微软雅黑", 10), state="readonly", width=22)
+        self.aggregation_combo.set(AGGREGATIONS["concat"])
+        self.aggregation_combo.pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(merge_frame, text="设置", command=self.set_merge_aggregation).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(merge_frame, text="重置", command=self.reset_merge_aggregations).pack(side=tk.LEFT, padx=(10, 0))
+    
+    def set_merge_aggregation(self):
+        """设置某一列合并重复行时的聚合方式"""
+        column = self.merge_column_combo.get()
+        if not column:
+            messagebox.showwarning("警告", "请选择要设置的列")
+            return
+        if column == self.date_column.get():
+            messagebox.showwarning("警告", "日期列固定保留第一行的值")
+            return
+        mode = next(mode for mode, label in AGGREGATIONS.items() if label == self.aggregation_combo.get())
+        self.merge_aggregations[column] = mode
+        settings = "，".join(f"{name}: {AGGREGATIONS[mode]}" for name, mode in self.merge_aggregations.items())
+        self.add_status_message(f"🔧 合并列设置: {settings}")
+    
+    def reset_merge_aggregations(self):
+        """清除列聚合设置，恢复为所有列相同时换行合并"""
+        self.merge_aggregations = {}
+        self.add_status_message("🔧 合并列设置已重置")
     
     def create_action_frame(self):
         """创建操作区域"""
@@ -202,6 +239,8 @@ class DateFilterTool:
             # 使用公共工具获取列名
             columns = ExcelUtils.get_excel_columns(filename)
             self.column_combo['values'] = columns
+            self.merge_column_combo['values'] = columns
+            self.merge_aggregations = {}
             if columns:
                 self.date_column.set(columns[0])
                 self.add_status_message(f"✅ 列信息刷新完成，共 {len(columns)} 列")
@@ -250,6 +289,57 @@ class DateFilterTool:
         else:
             self.process_table_standard_mode()
     
+    def parse_dates(self, date_values):
+        """用共用的日期解析器整列解析日期，并输出推断出的格式和慢速解析数"""
+        dates = self.date_parser.parse_column(date_values)
+        if self.date_parser.format:
+            self.add_status_message(f"📅 推断日期格式: {self.date_parser.format}，"
+                                    f"慢速解析 {self.date_parser.fallback_cells} 个单元格")
+        return dates
+    
+    def write_rows(self, worksheet, header, rows, style_name):
+        """把表头和行矩阵逐行流式写入只写工作表
+        
+        数据单元格共用一个命名样式（居中、自动换行），数据行行高设为50磅，表头和数据以下的空行保持默认行高；
+        写出的行不在内存中保留单元格对象。
+        """
+        worksheet.append(header)
+        for row_idx, row_data in enumerate(rows, start=2):
+            if not self.processing:
+                break
+            row_cells = []
+            for value in row_data:
+                cell = WriteOnlyCell(worksheet)
+                cell.style = style_name
+                cell.value = value  # 先套样式再赋值，日期值仍会得到日期数字格式
+                row_cells.append(cell)
+            worksheet.row_dimensions[row_idx].height = 50  # 行高在写出该行时一并写入
+            worksheet.append(row_cells)
+    
+    def merge_duplicate_rows(self, header, rows, dates, date_col):
+        """整表按日期和键列分组合并重复行，返回({日期: 合并后的行列表}, 被合并的行数)
+        
+        没有设置聚合方式的非日期列作为键列，这些列内容相同的同日期行合并为一行；
+        日期列保留第一行的值，设置了聚合方式的列按设置聚合，其余列换行合并。
+        """
+        width = len(header)
+        date_key = width  # 附加的日期分组列，输出时去掉
+        valid_rows = [row_idx for row_idx, date_obj in enumerate(dates) if date_obj]
+        frame = pd.DataFrame([rows[row_idx] for row_idx in valid_rows], columns=range(width), dtype=object)
+        frame[date_key] = [dates[row_idx] for row_idx in valid_rows]
+        
+        aggregations = {header.index(name): mode for name, mode in self.merge_aggregations.items() if name in header}
+        aggregations[date_col] = "first"
+        aggregations[date_key] = "first"
+        key_columns = [date_key] + [col for col in range(width) if col not in aggregations]
+        aggregator = GroupAggregator(key_columns, aggregations)
+        merged = aggregator.aggregate(frame)
+        
+        date_groups = {}
+        for row_data in merged.to_numpy(dtype=object).tolist():
+            date_groups.setdefault(row_data[date_key], []).append(row_data[:width])
+        return date_groups, aggregator.merged_count
+    
     def process_table_fast_mode(self):
         """快速模式处理 - 使用openpyxl快速处理数据，不保留图片"""
         try:
@@ -260,93 +350,52 @@ class DateFilterTool:
             # 更新进度
             self.update_progress(5, "正在准备处理...")
             
-            # 使用openpyxl读取Excel文件（只读数据）
+            # 只读模式流式读取一遍，得到表头和内存中的行矩阵，之后不再访问原工作簿
             self.update_progress(10, "📊 正在快速读取Excel文件数据...")
-            wb_original = load_workbook(self.file_path.get(), data_only=True)
-            ws_original = wb_original.active
-            
-            # 读取表头
-            header = [cell.value for cell in ws_original[1]]
-            if not header:
-                raise ValueError("Excel文件没有表头")
+            header, rows = ExcelUtils.read_sheet_rows(self.file_path.get())
             
             # 检查日期列是否存在
             date_col_name = self.date_column.get()
             if date_col_name not in header:
                 raise ValueError(f"未找到日期列: {date_col_name}")
             
-            date_col_idx = header.index(date_col_name) + 1
-            
-            # 获取数据范围
-            max_row = ws_original.max_row
+            date_col = header.index(date_col_name)
             
             # 读取日期数据
             self.update_progress(20, "📅 正在快速处理日期数据...")
-            date_groups = {}
-            total_rows = max_row - 1
+            total_rows = len(rows)
             
-            for row in range(2, max_row + 1):
-                if not self.processing:  # 检查是否被终止
-                    break
-                
-                date_value = ws_original.cell(row=row, column=date_col_idx).value
-                
-                # 使用公共工具解析日期
-                date_obj = ExcelUtils.parse_date_value(date_value)
-                if date_obj:
-                    if date_obj not in date_groups:
-                        date_groups[date_obj] = []
-                    date_groups[date_obj].append(row)
-                
-                # 更新进度 (20-40%)
-                if (row - 1) % 100 == 0 or row == max_row:
-                    progress = int((row - 1) / total_rows * 20) + 20
-                    self.update_progress(progress, f"正在分析日期数据: {row - 1}/{total_rows} 行")
+            # 整列取出后一次解析
+            date_values = [row[date_col] for row in rows]
+            self.update_progress(30, f"正在分析日期数据: {total_rows} 行")
+            dates = self.parse_dates(date_values)
+            self.update_progress(40, f"日期分析完成: {total_rows} 行")
             
             if not self.processing:
-                wb_original.close()
                 return
             
-            invalid_count = (max_row - 1) - sum(len(rows) for rows in date_groups.values())
+            invalid_count = total_rows - sum(1 for date_obj in dates if date_obj)
             if invalid_count > 0:
                 self.add_status_message(f"⚠️ 发现 {invalid_count} 行无效日期数据，已跳过")
             
-            # 按日期分组
+            # 按日期分组，并整表一次合并重复行（支持换行合并）
             self.update_progress(45, "📂 正在按日期分类数据...")
+            date_groups, merged_count = self.merge_duplicate_rows(header, rows, dates, date_col)
             
             # 创建新的Excel文件
             self.update_progress(50, "💾 正在创建新文件...")
             from openpyxl import Workbook
-            wb_new = Workbook()
-            wb_new.remove(wb_new.active)  # 删除默认工作表
+            from openpyxl.styles import Alignment, NamedStyle
+            wb_new = Workbook(write_only=True)  # 只写模式，没有默认工作表
+            body_style = NamedStyle(name=BODY_STYLE_NAME,
+                                    alignment=Alignment(horizontal='center', vertical='center', wrap_text=True))
+            wb_new.add_named_style(body_style)
             
             # 如果需要保留原表，先复制原数据
             if self.keep_original.get():
                 self.update_progress(55, "📄 正在复制原工作表...")
                 ws_original_copy = wb_new.create_sheet("原数据")
-                
-                # 复制表头
-                for col_idx, value in enumerate(header, 1):
-                    ws_original_copy.cell(row=1, column=col_idx).value = value
-                
-                # 复制数据行
-                for row in range(2, max_row + 1):
-                    if not self.processing:
-                        break
-                    for col_idx in range(1, len(header) + 1):
-                        value = ws_original.cell(row=row, column=col_idx).value
-                        ws_original_copy.cell(row=row, column=col_idx).value = value
-                
-                # 设置原数据工作表的行高为50磅、内容居中和自动换行
-                if max_row > 1:  # 有数据行
-                    for row_idx in range(2, max_row + 1):
-                        ws_original_copy.row_dimensions[row_idx].height = 50
-                    # 设置数据区域格式
-                    from openpyxl.styles import Alignment
-                    align_center = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                    for row in ws_original_copy.iter_rows(min_row=2, max_row=max_row, min_col=1, max_col=len(header)):
-                        for cell in row:
-                            cell.alignment = align_center
+                self.write_rows(ws_original_copy, header, rows, BODY_STYLE_NAME)
             
             # 为每个日期创建工作表
             total_groups = len(date_groups)
@@ -359,74 +408,12 @@ class DateFilterTool:
                 if not self.processing:
                     break
                 
-                row_numbers = date_groups[date]
-                
                 # 使用公共工具格式化工作表名称
                 sheet_name = ExcelUtils.format_sheet_name(date, self.date_format.get())
                 
-                # 创建新工作表
+                # 创建新工作表并写入合并后的行（行高50磅、内容居中和自动换行）
                 ws_new = wb_new.create_sheet(sheet_name)
-                
-                # 复制表头
-                for col_idx, value in enumerate(header, 1):
-                    ws_new.cell(row=1, column=col_idx).value = value
-                
-                # 复制数据行（支持换行合并）
-                target_row = 2
-                seen_rows = {}  # 用于记录已见的行，支持合并
-                merged_count = 0  # 记录合并次数
-                
-                for row_num in row_numbers:
-                    if not self.processing:
-                        break
-                    
-                    # 读取当前行的数据（排除日期列）
-                    row_data = []
-                    for col_idx in range(1, len(header) + 1):
-                        if col_idx != date_col_idx:  # 排除日期列
-                            value = ws_original.cell(row=row_num, column=col_idx).value
-                            row_data.append(value)
-                    
-                    # 创建行的唯一键（基于非日期列的数据）
-                    row_key = tuple(str(v) if v is not None else '' for v in row_data)
-                    
-                    if row_key in seen_rows:
-                        # 如果已存在相同行，执行合并逻辑
-                        existing_row = seen_rows[row_key]
-                        merged_count += 1  # 记录合并次数
-                        
-                        # 对于某些列，如果值不同，则用换行符合并
-                        for col_idx in range(1, len(header) + 1):
-                            if col_idx != date_col_idx:  # 排除日期列
-                                new_value = ws_original.cell(row=row_num, column=col_idx).value
-                                existing_value = ws_new.cell(row=existing_row, column=col_idx).value
-                                
-                                if new_value and new_value != existing_value:
-                                    # 如果新值不为空且与现有值不同，进行换行合并
-                                    if existing_value:
-                                        merged_value = f"{existing_value}\n{new_value}"
-                                    else:
-                                        merged_value = str(new_value)
-                                    ws_new.cell(row=existing_row, column=col_idx).value = merged_value
-                    else:
-                        # 新行，直接复制
-                        for col_idx in range(1, len(header) + 1):
-                            value = ws_original.cell(row=row_num, column=col_idx).value
-                            ws_new.cell(row=target_row, column=col_idx).value = value
-                        
-                        seen_rows[row_key] = target_row
-                        target_row += 1
-                
-                # 设置行高为50磅、内容居中和自动换行（快速模式）
-                if target_row > 2:  # 有数据行
-                    for row_idx in range(2, target_row):
-                        ws_new.row_dimensions[row_idx].height = 50
-                    # 设置数据区域格式
-                    from openpyxl.styles import Alignment
-                    align_center = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                    for row in ws_new.iter_rows(min_row=2, max_row=target_row-1, min_col=1, max_col=len(header)):
-                        for cell in row:
-                            cell.alignment = align_center
+                self.write_rows(ws_new, header, date_groups[date], BODY_STYLE_NAME)
                 
                 processed += 1
                 # 更新进度 (55-90%)
@@ -434,18 +421,15 @@ class DateFilterTool:
                 self.update_progress(progress, f"📊 已处理 {processed}/{total_groups} 个日期: {sheet_name}")
             
             if not self.processing:
-                wb_original.close()
                 return
             
             # 保存文件
             output_path = self.get_save_location()
             if not output_path:
-                wb_original.close()
                 return
                 
             self.update_progress(95, "💾 正在保存文件...")
             wb_new.save(output_path)
-            wb_original.close()
             
             # 计算耗时
             elapsed_time = time.time() - start_time
@@ -530,20 +514,13 @@ class DateFilterTool:
             valid_rows = []
             total_rows = len(date_values_raw)
             
-            for i, date_value in enumerate(date_values_raw):
-                if not self.processing:
-                    break
-                
-                # 使用公共工具解析日期
-                date_obj = ExcelUtils.parse_date_value(date_value)
+            # 整列一次解析
+            self.update_progress(30, f"正在分析日期数据: {total_rows} 行")
+            for i, date_obj in enumerate(self.parse_dates(date_values_raw)):
                 if date_obj:
                     date_values.append(date_obj)
                     valid_rows.append(i + 2)  # +2 因为从第2行开始
-                
-                # 更新进度 (20-40%)
-                if (i + 1) % 100 == 0 or i == total_rows - 1:
-                    progress = int((i + 1) / total_rows * 20) + 20
-                    self.update_progress(progress, f"正在分析日期数据: {i + 1}/{total_rows} 行")
+            self.update_progress(40, f"日期分析完成: {total_rows} 行")
             
             if not self.processing:
                 wb_original.close()
@@ -1032,6 +1009,8 @@ class DateFilterTool:
         self.file_path.set("")
         self.date_column.set("")
         self.column_combo['values'] = []
+        self.merge_column_combo['values'] = []
+        self.merge_aggregations = {}
         self.output_file_path = None
         self.open_result_btn.config(state=tk.DISABLED)
         
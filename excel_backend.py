@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作簿后端
+把工具用到的工作簿操作（打开、读取区域、写入区域、设置区域样式、保存）抽象成统一接口，
+提供xlwings、openpyxl两种实现和一个统计调用次数的内存实现
+"""
+from collections import Counter
+
+
+# 结果列样式：颜色均为RGB十六进制，对齐取值为left/center/right、top/center/bottom
+HEADER_STYLE = {"bold": True, "font_color": "FFFFFF", "fill_color": "4F81BD", "horizontal": "center"}
+DATA_STYLE = {"horizontal": "center", "vertical": "center", "wrap_text": True, "row_height": 50}
+
+
+class ExcelWorkbook:
+    """工作簿操作接口，所有操作都针对第一个工作表，行列号从1开始
+
+    read_range返回二维列表（每行一个列表），write_range接收同样结构的二维列表；
+    实现应保证一次调用只产生一次与Excel的往返，调用方按区域批量读写。
+    """
+
+    def max_row(self):
+        """返回最后一个有数据的行号"""
+        raise NotImplementedError
+
+    def max_column(self):
+        """返回最后一个有数据的列号"""
+        raise NotImplementedError
+
+    def read_range(self, first_row, first_col, last_row, last_col):
+        """读取矩形区域的值"""
+        raise NotImplementedError
+
+    def write_range(self, first_row, first_col, rows):
+        """从(first_row, first_col)开始写入二维列表"""
+        raise NotImplementedError
+
+    def style_range(self, first_row, first_col, last_row, last_col, style):
+        """设置矩形区域的样式，style为HEADER_STYLE/DATA_STYLE格式的字典"""
+        raise NotImplementedError
+
+    def delete_rows(self, first_row, last_row):
+        """删除连续的整行，下方的行上移"""
+        raise NotImplementedError
+
+    def insert_columns(self, first_col, count):
+        """在first_col处插入count个空列，原有的列右移"""
+        raise NotImplementedError
+
+    def add_sheet(self, name, rows):
+        """在最后新增工作表并从A1开始写入二维列表"""
+        raise NotImplementedError
+
+    def save(self, path):
+        """保存到指定路径"""
+        raise NotImplementedError
+
+    def close(self):
+        """关闭工作簿"""
+        raise NotImplementedError
+
+    def read_header(self):
+        """读取表头（第一行）"""
+        last_col = self.max_column()
+        if last_col < 1:
+            return []
+        return self.read_range(1, 1, 1, last_col)[0]
+
+    def read_columns(self, col_indexes, last_row):
+        """一次读取覆盖所有指定列的区域（从第2行开始），返回每列一个列表"""
+        if not col_indexes or last_row < 2:
+            return [[] for _ in col_indexes]
+        min_col = min(col_indexes)
+        rows = self.read_range(2, min_col, last_row, max(col_indexes))
+        return [[row[col_idx - min_col] for row in rows] for col_idx in col_indexes]
+
+
+class XlwingsWorkbook(ExcelWorkbook):
+    """通过xlwings(COM)操作的工作簿"""
+
+    # Excel对齐常量
+    HORIZONTAL = {"left": -4131, "center": -4108, "right": -4152}
+    VERTICAL = {"top": -4160, "center": -4108, "bottom": -4107}
+
+    def __init__(self, book):
+        self.book = book
+        self.ws = book.sheets[0]
+
+    def max_row(self):
+        last_row = self.ws.range('A' + str(self.ws.cells.last_cell.row)).end('up').row
+        if last_row < 2:
+            last_row = self.ws.used_range.last_cell.row
+        return last_row
+
+    def max_column(self):
+        return self.ws.used_range.last_cell.column
+
+    def read_range(self, first_row, first_col, last_row, last_col):
+        return self.ws.range((first_row, first_col), (last_row, last_col)).options(ndim=2).value
+
+    def write_range(self, first_row, first_col, rows):
+        if rows:
+            self.ws.range((first_row, first_col)).value = rows
+
+    def style_range(self, first_row, first_col, last_row, last_col, style):
+        api = self.ws.range((first_row, first_col), (last_row, last_col)).api
+        if "bold" in style:
+            api.Font.Bold = style["bold"]
+        if "font_color" in style:
+            api.Font.Color = rgb_to_excel_color(style["font_color"])
+        if "fill_color" in style:
+            api.Interior.Color = rgb_to_excel_color(style["fill_color"])
+        if "horizontal" in style:
+            api.HorizontalAlignment = self.HORIZONTAL[style["horizontal"]]
+        if "vertical" in style:
+            api.VerticalAlignment = self.VERTICAL[style["vertical"]]
+        if "wrap_text" in style:
+            api.WrapText = style["wrap_text"]
+        if "row_height" in style:
+            api.EntireRow.RowHeight = style["row_height"]
+
+    def delete_rows(self, first_row, last_row):
+        self.ws.range(f"{first_row}:{last_row}").api.Delete()
+
+    def insert_columns(self, first_col, count):
+        self.ws.range((1, first_col), (1, first_col + count - 1)).api.EntireColumn.Insert()
+
+    def add_sheet(self, name, rows):
+        sheet = self.book.sheets.add(name, after=self.book.sheets[-1])
+        if rows:
+            sheet.range("A1").value = rows
+
+    def save(self, path):
+        self.book.save(path)
+
+    def close(self):
+        self.book.close()
+
+
+class XlwingsBackend:
+    """xlwings后端，使用调用方创建的Excel实例"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def open(self, path):
+        return XlwingsWorkbook(self.app.books.open(path))
+
+
+class OpenpyxlWorkbook(ExcelWorkbook):
+    """通过openpyxl在内存中操作的工作簿"""
+
+    def __init__(self, wb):
+        self.wb = wb
+        self.ws = wb.active
+        self._styles = {}  # 同一样式字典只创建一次样式对象
+
+    def max_row(self):
+        return self.ws.max_row
+
+    def max_column(self):
+        return self.ws.max_column
+
+    def read_range(self, first_row, first_col, last_row, last_col):
+        return [list(row) for row in self.ws.iter_rows(min_row=first_row, max_row=last_row, min_col=first_col,
+                                                       max_col=last_col, values_only=True)]
+
+    def write_range(self, first_row, first_col, rows):
+        for row_idx, row in enumerate(rows, start=first_row):
+            for col_idx, value in enumerate(row, start=first_col):
+                self.ws.cell(row=row_idx, column=col_idx).value = value
+
+    def _style_objects(self, style):
+        from openpyxl.styles import Alignment, Font, PatternFill
+
+        style_key = tuple(sorted(style.items()))
+        objects = self._styles.get(style_key)
+        if objects is None:
+            font = None
+            if "bold" in style or "font_color" in style:
+                font = Font(bold=style.get("bold", False), color=style.get("font_color"))
+            fill = None
+            if "fill_color" in style:
+                fill = PatternFill(fill_type="solid", fgColor=style["fill_color"])
+            alignment = None
+            if "horizontal" in style or "vertical" in style or "wrap_text" in style:
+                alignment = Alignment(horizontal=style.get("horizontal"), vertical=style.get("vertical"),
+                                      wrap_text=style.get("wrap_text"))
+            objects = (font, fill, alignment)
+            self._styles[style_key] = objects
+        return objects
+
+    def style_range(self, first_row, first_col, last_row, last_col, style):
+        font, fill, alignment = self._style_objects(style)
+        for row in self.ws.iter_rows(min_row=first_row, max_row=last_row, min_col=first_col, max_col=last_col):
+            for cell in row:
+                if font is not None:
+                    cell.font = font
+                if fill is not None:
+                    cell.fill = fill
+                if alignment is not None:
+                    cell.alignment = alignment
+        if "row_height" in style:
+            for row_idx in range(first_row, last_row + 1):
+                self.ws.row_dimensions[row_idx].height = style["row_height"]
+
+    def delete_rows(self, first_row, last_row):
+        self.ws.delete_rows(first_row, last_row - first_row + 1)
+
+    def insert_columns(self, first_col, count):
+        self.ws.insert_cols(first_col, count)
+
+    def add_sheet(self, name, rows):
+        ws = self.wb.create_sheet(name)
+        for row in rows:
+            ws.append(row)
+
+    def save(self, path):
+        self.wb.save(path)
+
+    def close(self):
+        self.wb.close()
+
+
+class OpenpyxlBackend:
+    """openpyxl后端，不需要Excel"""
+
+    def open(self, path):
+        from openpyxl import load_workbook
+
+        return OpenpyxlWorkbook(load_workbook(path, data_only=True))
+
+
+class FakeWorkbook(ExcelWorkbook):
+    """内存中的工作簿，每次操作计为一次往返"""
+
+    def __init__(self, backend, rows):
+        self.backend = backend
+        self.cells = {}
+        self.styles = {}
+        self.sheets = {}  # 新增的工作表 -> 二维列表
+        for row_idx, row in enumerate(rows, start=1):
+            for col_idx, value in enumerate(row, start=1):
+                if value is not None:
+                    self.cells[(row_idx, col_idx)] = value
+
+    def _count(self, operation):
+        self.backend.calls[operation] += 1
+
+    def max_row(self):
+        self._count("max_row")
+        return max((row for row, _ in self.cells), default=0)
+
+    def max_column(self):
+        self._count("max_column")
+        return max((col for _, col in self.cells), default=0)
+
+    def read_range(self, first_row, first_col, last_row, last_col):
+        self._count("read_range")
+        return [[self.cells.get((row, col)) for col in range(first_col, last_col + 1)]
+                for row in range(first_row, last_row + 1)]
+
+    def write_range(self, first_row, first_col, rows):
+        self._count("write_range")
+        for row_idx, row in enumerate(rows, start=first_row):
+            for col_idx, value in enumerate(row, start=first_col):
+                self.cells[(row_idx, col_idx)] = value
+
+    def style_range(self, first_row, first_col, last_row, last_col, style):
+        self._count("style_range")
+        self.styles[(first_row, first_col, last_row, last_col)] = dict(style)
+
+    def delete_rows(self, first_row, last_row):
+        self._count("delete_rows")
+        count = last_row - first_row + 1
+        self.cells = {(row - count if row > last_row else row, col): value
+                      for (row, col), value in self.cells.items() if not first_row <= row <= last_row}
+
+    def insert_columns(self, first_col, count):
+        self._count("insert_columns")
+        self.cells = {(row, col + count if col >= first_col else col): value
+                      for (row, col), value in self.cells.items()}
+
+    def add_sheet(self, name, rows):
+        self._count("add_sheet")
+        self.sheets[name] = [list(row) for row in rows]
+
+    def save(self, path):
+        self._count("save")
+        last_row = max((row for row, _ in self.cells), default=0)
+        last_col = max((col for _, col in self.cells), default=0)
+        self.backend.saved[path] = [[self.cells.get((row, col)) for col in range(1, last_col + 1)]
+                                    for row in range(1, last_row + 1)]
+
+    def close(self):
+        self._count("close")
+
+
+class FakeBackend:
+    """内存后端：files为{路径: 二维列表}，calls统计各操作的调用次数，saved保存写出的结果"""
+
+    def __init__(self, files=None):
+        self.files = dict(files or {})
+        self.calls = Counter()
+        self.saved = {}
+
+    def open(self, path):
+        self.calls["open"] += 1
+        if path not in self.files:
+            raise FileNotFoundError(path)
+        return FakeWorkbook(self, self.files[path])
+
+    @property
+    def round_trips(self):
+        """总往返次数"""
+        return sum(self.calls.values())
+
+
+def rgb_to_excel_color(rgb):
+    """把RGB十六进制颜色转换为Excel使用的BGR整数"""
+    value = int(rgb, 16)
+    red, green, blue = (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF
+    return (blue << 16) | (green << 8) | red
+
+
+def benchmark_round_trips(row_counts=(100, 1000, 10000)):
+    """在内存后端上运行标准模式，检查往返次数与行数无关，返回{行数: 往返次数}"""
+    from vlookup_engine import VlookupEngine
+
+    results = {}
+    for rows in row_counts:
+        ref_rows = [["ID", "Name"]] + [[i, f"name{i}"] for i in range(rows)]
+        main_rows = [["Key", "Other"]] + [[f"{i}\n{i * 2}", f"o{i}"] for i in range(rows)]
+        backend = FakeBackend({"ref.xlsx": ref_rows, "main.xlsx": main_rows})
+        engine = VlookupEngine()
+
+        book = backend.open("ref.xlsx")
+        lookup_dict = engine.build_lookup_dict(book, "ID", "Name")
+        book.close()
+        book = backend.open("main.xlsx")
+        engine.process_main_table_fast(book, "Key", ["Name"], lookup_dict, "", ["Other"])
+        book.save("out.xlsx")
+        book.close()
+
+        assert backend.saved["out.xlsx"][1][2] == "name0\nname0"
+        results[rows] = backend.round_trips
+
+    assert len(set(results.values())) == 1, f"往返次数随行数增长: {results}"
+    return results
+
+
+if __name__ == "__main__":
+    for rows, round_trips in benchmark_round_trips().items():
+        print(f"{rows} 行: {round_trips} 次往返")
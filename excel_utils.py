@@ -4,10 +4,13 @@ Excel工具公共模块
 """
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+import numpy as np
 import pandas as pd
 import os
 import time
-from datetime import datetime
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from openpyxl import load_workbook
 
 
 class ExcelUtils:
@@ -48,6 +51,33 @@ class ExcelUtils:
         except Exception as e:
             raise ValueError(f"读取Excel文件列名失败: {str(e)}")
     
+    @staticmethod
+    def read_sheet_rows(file_path):
+        """以只读模式流式读取活动工作表，返回(表头列表, 数据行列表)
+        
+        每个数据行都是与表头等长的值列表，读取完成后关闭文件，后续处理不再访问原工作簿。
+        """
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            header = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), None)
+            if not header:
+                raise ValueError("Excel文件没有表头")
+            header = list(header)
+            width = len(header)
+            rows = []
+            for row in ws.iter_rows(min_row=2, max_col=width, values_only=True):
+                row = list(row)
+                if len(row) < width:
+                    row.extend([None] * (width - len(row)))
+                rows.append(row)
+            # 工作表尺寸信息可能包含末尾的空行，与完整加载时的行数保持一致
+            while rows and all(value is None for value in rows[-1]):
+                rows.pop()
+            return header, rows
+        finally:
+            wb.close()
+    
     @staticmethod
     def get_save_location(default_name, title="保存文件"):
         """获取保存位置"""
@@ -61,23 +91,32 @@ class ExcelUtils:
     
     @staticmethod
     def parse_date_value(date_value):
-        """解析日期值，支持多种格式"""
+        """解析日期值，支持多种格式；数值按Excel日期序列号换算"""
         if not date_value:
             return None
+        if isinstance(date_value, (int, float)) and not isinstance(date_value, bool):
+            return ExcelUtils.excel_serial_to_date(date_value)
             
         try:
             # 尝试pandas的日期解析
             return pd.to_datetime(date_value).date()
-        except:
+        except (ValueError, TypeError, OverflowError):
             # 如果pandas解析失败，尝试手动解析
             if isinstance(date_value, str):
-                for fmt in ['%Y-%m-%d', '%Y/%m/%d', '%Y年%m月%d日', '%m-%d-%Y', '%d/%m/%Y']:
+                for fmt in DATE_PARSE_PATTERNS:
                     try:
                         return datetime.strptime(str(date_value).strip(), fmt).date()
                     except ValueError:
                         continue
         return None
     
+    @staticmethod
+    def excel_serial_to_date(serial):
+        """把Excel日期序列号转换为日期，超出Excel日期范围时返回None"""
+        if not 1 <= serial < MAX_EXCEL_SERIAL:
+            return None
+        return (EXCEL_EPOCH + timedelta(days=int(serial))).date()
+    
     @staticmethod
     def create_ui_frame(parent, title, subtitle):
         """创建统一的UI标题框架"""
@@ -120,5 +159,130 @@ class ExcelUtils:
         status_text.see(tk.END)
 
 
+class DateParser:
+    """按列解析日期：从样本推断主要的文本格式，相同的原始文本只解析一次
+
+    parse_column中datetime/date直接取日期，数值按Excel日期序列号整批换算；
+    文本先查有界的结果缓存，未命中的去重后先用推断出的主要格式整批转换，
+    剩下的再按DATE_PARSE_PATTERNS其余格式整批尝试，最后逐个交给parse_date_value。
+    不是主要格式解析出来的文本单元格计入fallback_cells。
+    """
+
+    def __init__(self, sample_size=1000, cache_size=50000):
+        self.sample_size = sample_size  # 推断格式时最多取的不同文本个数
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # 原始文本 -> 日期，按最近使用淘汰
+        self.format = None  # 最近一次推断出的主要格式，没有文本时为None
+        self.fallback_cells = 0  # 最近一次解析中需要慢速解析的单元格数
+
+    def infer_format(self, texts):
+        """从文本样本中选出能解析最多值的格式，个数相同时取DATE_PARSE_PATTERNS中靠前的"""
+        sample = pd.Series(pd.unique(np.asarray(texts, dtype=object))[:self.sample_size], dtype=object)
+        best_format = None
+        best_count = 0
+        for pattern in DATE_PARSE_PATTERNS:
+            count = int(pd.to_datetime(sample, format=pattern, errors="coerce").notna().sum())
+            if count > best_count:
+                best_format, best_count = pattern, count
+        return best_format
+
+    def remember(self, text, day):
+        """记住一个日期文本的解析结果，超过cache_size时淘汰最久未使用的"""
+        self.cache[text] = day
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def parse_column(self, values):
+        """整列解析日期，返回与values逐个对应的日期列表（无法解析的为None）"""
+        results = [None] * len(values)
+        serial_positions, serials = [], []
+        text_positions, texts = [], []
+        leftover = []
+        for i, value in enumerate(values):
+            if not value:  # 与parse_date_value一致，空值和0视为无效
+                continue
+            if isinstance(value, datetime):
+                results[i] = value.date()
+            elif isinstance(value, date):
+                results[i] = value
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                serial_positions.append(i)
+                serials.append(value)
+            elif isinstance(value, str):
+                text = value.strip()
+                if text:
+                    text_positions.append(i)
+                    texts.append(text)
+            else:
+                leftover.append(i)
+        
+        # Excel日期序列号：整批换算，忽略时间部分
+        if serials:
+            days = np.asarray(serials, dtype=np.float64)
+            valid = (days >= 1) & (days < MAX_EXCEL_SERIAL)
+            positions = np.asarray(serial_positions)[valid]
+            dates = pd.to_datetime(np.floor(days[valid]), unit="D", origin=EXCEL_EPOCH).date
+            for position, day in zip(positions.tolist(), dates):
+                results[position] = day
+        
+        self.fallback_cells = len(leftover)
+        if texts:
+            self.parse_texts(texts, text_positions, results)
+        for i in leftover:
+            results[i] = ExcelUtils.parse_date_value(values[i])
+        return results
+
+    def parse_texts(self, texts, positions, results):
+        """解析去除首尾空白后的日期文本，结果写入results对应位置"""
+        text_format = self.infer_format(texts)
+        if text_format != self.format:
+            self.cache.clear()  # 日月顺序等可能随格式变化，缓存的结果不再适用
+            self.format = text_format
+        
+        codes, uniques = pd.factorize(np.asarray(texts, dtype=object))
+        unique_dates = [None] * len(uniques)
+        slow = np.zeros(len(uniques), dtype=bool)  # 不是主要格式解析出来的文本
+        missing = []
+        for index, text in enumerate(uniques.tolist()):
+            day = self.cache.get(text, _MISSING)
+            if day is _MISSING:
+                missing.append(index)
+            else:
+                self.cache.move_to_end(text)
+                unique_dates[index] = day
+        
+        pending = pd.Series(uniques[missing], index=missing, dtype=object)
+        patterns = [self.format] if self.format else []
+        patterns += [pattern for pattern in DATE_PARSE_PATTERNS if pattern != self.format]
+        for pattern in patterns:
+            if not len(pending):
+                break
+            parsed = pd.to_datetime(pending, format=pattern, errors="coerce")
+            ok = parsed.notna().to_numpy()
+            if ok.any():
+                for index, day in zip(pending.index[ok].tolist(), parsed[ok].dt.date):
+                    unique_dates[index] = day
+                if pattern != self.format:
+                    slow[pending.index[ok]] = True
+                pending = pending[~ok]
+        for index, text in pending.items():
+            unique_dates[index] = ExcelUtils.parse_date_value(text)
+            slow[index] = True
+        for index in missing:
+            self.remember(uniques[index], unique_dates[index])
+        
+        self.fallback_cells += int(np.bincount(codes, minlength=len(uniques))[slow].sum())
+        for position, code in zip(positions, codes.tolist()):
+            results[position] = unique_dates[code]
+
+
 # 日期格式选项常量
 DATE_FORMATS = ["YYYY-MM-DD", "YYYY/MM/DD", "YYYY年MM月DD日", "MM-DD-YYYY", "DD/MM/YYYY"]
+
+# 解析日期文本时依次尝试的格式：DATE_FORMATS对应的格式和带时间的写法；
+# 斜杠分隔的日月顺序不确定时先按月/日/年，与pandas默认的解析结果一致
+DATE_PARSE_PATTERNS = ['%Y-%m-%d', '%Y/%m/%d', '%Y年%m月%d日', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d %H:%M:%S',
+                       '%m-%d-%Y', '%m/%d/%Y', '%d/%m/%Y']
+EXCEL_EPOCH = datetime(1899, 12, 30)  # Excel日期序列号的起点
+MAX_EXCEL_SERIAL = 2958466  # 9999-12-31之后的序列号不是有效日期
+_MISSING = object()
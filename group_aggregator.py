@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重复行分组聚合
+按键列把内容相同的行分为一组，按列整体计算分组编号，每组只在最后聚合一次，
+不再逐行把新值拼接到已合并的文本上
+"""
+import numpy as np
+import pandas as pd
+
+# 每列的聚合方式
+AGGREGATIONS = {
+    "concat": "换行合并（与前值不同时追加）",
+    "distinct": "换行合并去重",
+    "sum": "求和",
+    "count": "计数",
+    "first": "保留第一个",
+    "last": "保留最后一个",
+}
+
+DEFAULT_AGGREGATION = "concat"  # 与原来的换行合并一致
+
+
+def concat_values(values):
+    """按行顺序合并：值非空且与当前结果不同时用换行追加，结果与逐行 f"{前值}\\n{新值}" 拼接一致"""
+    result = values[0]
+    parts = None  # 已合并为多行文本后的各行
+    for value in values[1:]:
+        if not value:
+            continue
+        if parts is None:
+            if value == result:
+                continue
+            if result:
+                parts = [str(result), str(value)]
+            else:
+                result = str(value)
+        elif not (isinstance(value, str) and "\n" in value and value == "\n".join(parts)):
+            parts.append(str(value))
+    return result if parts is None else "\n".join(parts)
+
+
+def distinct_values(values):
+    """去掉空值和文本重复的值后用换行合并，只剩一个值时保留原值"""
+    seen = {}
+    for value in values:
+        if value is not None and value != "":
+            seen.setdefault(str(value), value)
+    if not seen:
+        return values[0]
+    if len(seen) == 1:
+        return next(iter(seen.values()))
+    return "\n".join(seen)
+
+
+def as_number(value):
+    """整数值的浮点数还原为整数，避免结果显示为123.0"""
+    return int(value) if float(value).is_integer() else float(value)
+
+
+class GroupAggregator:
+    """按键列分组并逐列聚合的表格
+
+    key_columns为参与分组的列，行键为这些列的值转成的文本（空单元格为空字符串）；
+    aggregations为{列: 聚合方式}，未指定的列（包括键列本身）使用换行合并，
+    因此文本相同而原值不同的键列值也会合并。结果按各组首次出现的顺序排列。
+    """
+
+    def __init__(self, key_columns, aggregations=None):
+        aggregations = dict(aggregations or {})
+        unknown = [mode for mode in aggregations.values() if mode not in AGGREGATIONS]
+        if unknown:
+            raise ValueError(f"不支持的聚合方式: {', '.join(unknown)}")
+        self.key_columns = list(key_columns)
+        self.aggregations = aggregations
+        self.merged_count = 0  # 最近一次聚合中被并入其他行的行数
+
+    def group_codes(self, frame):
+        """每行的分组编号，按首次出现的顺序从0开始"""
+        if not self.key_columns:
+            return np.arange(len(frame))
+        keys = [frame[column].astype(str).mask(frame[column].isna(), "") for column in self.key_columns]
+        return frame.groupby(keys, sort=False).ngroup().to_numpy()
+
+    def aggregate(self, frame):
+        """聚合列式表格（DataFrame），返回每组一行、列与输入相同的DataFrame"""
+        codes = self.group_codes(frame)
+        group_count = int(codes.max()) + 1 if len(codes) else 0
+        self.merged_count = len(codes) - group_count
+
+        sizes = np.bincount(codes, minlength=group_count)
+        first_rows = np.unique(codes, return_index=True)[1]
+        last_rows = len(codes) - 1 - np.unique(codes[::-1], return_index=True)[1]
+        # 多行组各行的位置，按组分段、组内保持原顺序
+        multi_groups = np.flatnonzero(sizes > 1)
+        order = np.argsort(codes, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1])) if group_count else sizes
+
+        result = {}
+        for column in frame.columns:
+            mode = self.aggregations.get(column, DEFAULT_AGGREGATION)
+            values = frame[column].to_numpy(dtype=object)
+            if mode == "last":
+                result[column] = values[last_rows].tolist()
+            elif mode == "count":
+                filled = ~(frame[column].isna().to_numpy() | (values == ""))
+                result[column] = np.bincount(codes, weights=filled, minlength=group_count).astype(int).tolist()
+            elif mode == "sum":
+                numbers = pd.to_numeric(frame[column], errors="coerce").fillna(0).to_numpy(dtype=float)
+                totals = np.bincount(codes, weights=numbers, minlength=group_count)
+                result[column] = [as_number(total) for total in totals.tolist()]
+            else:
+                column_values = values[first_rows].tolist()
+                if mode != "first":
+                    combine = concat_values if mode == "concat" else distinct_values
+                    for group in multi_groups.tolist():
+                        rows = order[starts[group]:starts[group] + sizes[group]]
+                        column_values[group] = combine(values[rows].tolist())
+                result[column] = column_values
+        return pd.DataFrame(result, columns=frame.columns, dtype=object)
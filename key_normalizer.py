@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查找键规范化
+构建参考表索引时对每个键、查找主表时对每个查找值各做一次规范化，
+让123与123.0、全角ＡＢＣ与半角ABC、大小写不同的键能够直接匹配
+"""
+import re
+import unicodedata
+
+# 键规范化方式
+KEY_NORMALIZATIONS = {
+    "numeric": "数值统一（123.0→123）",
+    "width": "全角转半角",
+    "case": "忽略大小写",
+    "space": "合并连续空白",
+}
+
+INTEGRAL_NUMBER = re.compile(r"([+-]?\d+)\.0+")  # 小数部分全为0的数值文本
+
+
+class KeyNormalizer:
+    """按选定的规范化方式处理键文本，未选择任何方式时只去除首尾空白
+
+    各方式按固定顺序执行：全角转半角、合并空白、忽略大小写、数值统一，
+    这样全角数字“１２３.０”也能统一为“123”。
+    """
+
+    def __init__(self, modes=()):
+        unknown = [mode for mode in modes if mode not in KEY_NORMALIZATIONS]
+        if unknown:
+            raise ValueError(f"不支持的键规范化方式: {', '.join(unknown)}")
+        self.modes = tuple(mode for mode in KEY_NORMALIZATIONS if mode in modes)
+        self.width = "width" in self.modes
+        self.space = "space" in self.modes
+        self.case = "case" in self.modes
+        self.numeric = "numeric" in self.modes
+
+    @property
+    def tag(self):
+        """区分不同规范化方式的索引缓存"""
+        return "+".join(self.modes) or "strip"
+
+    def __call__(self, text):
+        """规范化一个查找值文本"""
+        text = text.strip()
+        if not self.modes:
+            return text
+        if self.width:
+            text = unicodedata.normalize("NFKC", text)
+        if self.space:
+            text = " ".join(text.split())
+        if self.case:
+            text = text.casefold()
+        if self.numeric:
+            match = INTEGRAL_NUMBER.fullmatch(text)
+            if match:
+                text = match.group(1)
+        return text
+
+    def value(self, value):
+        """规范化一个单元格值，空单元格为空字符串"""
+        if value is None:
+            return ""
+        if self.numeric and isinstance(value, float) and value.is_integer():
+            value = int(value)  # 避免大数值以1e+16形式出现
+        return self(str(value))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+参考表索引磁盘缓存
+按工作簿指纹缓存已构建的查找索引，同一参考表反复查找时无需重新解析
+"""
+import os
+import sys
+import hashlib
+import pickle
+import struct
+
+
+class LookupIndexCache:
+    """参考表查找索引的磁盘缓存
+
+    缓存键由文件路径、大小、修改时间、内容哈希、工作表以及(搜索列, 结果列)组成，
+    工作簿一旦变化缓存自动失效；总大小超过上限时按最近使用时间淘汰(LRU)。
+    每个条目在pickle数据前有一个头部记录索引条数，不反序列化就能判断索引大小。
+    """
+
+    FILE_SUFFIX = ".idx"
+    SQLITE_SUFFIX = ".sqlite"  # 超过内存预算时使用的SQLite磁盘索引
+    SUFFIXES = (FILE_SUFFIX, SQLITE_SUFFIX)
+    MAGIC = b"LKIDX002"
+    HEADER = struct.Struct("<8sQ")  # 格式标记, 索引条数
+
+    def __init__(self, cache_dir=None, max_bytes=512 * 1024 * 1024):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser("~"), ".excel_tools", "lookup_cache")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._hash_memo = {}  # (路径, 大小, 修改时间) -> 内容哈希，避免同一文件重复计算
+
+    def fingerprint(self, file_path):
+        """计算工作簿指纹：(绝对路径, 大小, 修改时间, 内容哈希)"""
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        memo_key = (path, stat.st_size, stat.st_mtime_ns)
+        content_hash = self._hash_memo.get(memo_key)
+        if content_hash is None:
+            digest = hashlib.sha1()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            content_hash = digest.hexdigest()
+            self._hash_memo[memo_key] = content_hash
+        return path, stat.st_size, stat.st_mtime_ns, content_hash
+
+    def make_key(self, file_path, search_column, result_column, sheet_name=None, source="openpyxl"):
+        """生成缓存键，同一工作簿同一列组合的不同版本共享相同前缀"""
+        path, size, mtime_ns, content_hash = self.fingerprint(file_path)
+        params = repr((path, sheet_name or "<active>", search_column, result_column, source,
+                       sys.version_info[:2]))
+        prefix = hashlib.sha1(params.encode("utf-8")).hexdigest()[:16]
+        version = hashlib.sha1(f"{size}|{mtime_ns}|{content_hash}".encode("utf-8")).hexdigest()[:16]
+        return f"{prefix}_{version}"
+
+    def _entry_path(self, key, suffix=FILE_SUFFIX):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def sqlite_path(self, key):
+        """SQLite磁盘索引的文件路径，与pickle缓存使用同一个缓存键"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return self._entry_path(key, self.SQLITE_SUFFIX)
+
+    def touch(self, key, suffix=SQLITE_SUFFIX):
+        """标记缓存条目最近被使用"""
+        try:
+            os.utime(self._entry_path(key, suffix))
+        except OSError:
+            pass
+
+    def read_header(self, f):
+        """读取条目头部，返回索引条数；旧格式或损坏的条目返回None"""
+        try:
+            magic, entry_count = self.HEADER.unpack(f.read(self.HEADER.size))
+        except struct.error:
+            return None
+        return entry_count if magic == self.MAGIC else None
+
+    def entry_count(self, key):
+        """只读取条目头部，返回缓存索引的条数，未命中返回None"""
+        try:
+            with open(self._entry_path(key), "rb") as f:
+                return self.read_header(f)
+        except OSError:
+            return None
+
+    def load(self, key):
+        """读取缓存的索引，未命中返回None"""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as f:
+                if self.read_header(f) is None:
+                    return None
+                lookup_dict = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # 更新修改时间作为最近使用时间
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return lookup_dict
+
+    def store(self, key, lookup_dict):
+        """写入索引缓存，同时删除同一工作簿的旧版本并执行容量淘汰"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry_path = self._entry_path(key)
+        temp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, len(lookup_dict)))
+            pickle.dump(lookup_dict, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, entry_path)
+        self.register(key, self.FILE_SUFFIX)
+
+    def register(self, key, suffix=FILE_SUFFIX):
+        """新条目写入后调用：删除同一工作簿的旧版本并执行容量淘汰"""
+        # 工作簿已变化的旧版本缓存直接失效
+        prefix = key.split("_")[0] + "_"
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and name != key + suffix and name.endswith(self.SUFFIXES):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+        self.evict()
+
+    def evict(self):
+        """按最近使用时间淘汰缓存，直到总大小不超过上限"""
+        entries = []
+        total_bytes = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.SUFFIXES):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_bytes += stat.st_size
+
+        entries.sort()
+        while entries and total_bytes > self.max_bytes:
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        """清空所有缓存"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(self.SUFFIXES):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
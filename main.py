@@ -8,6 +8,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import os
 import sys
+import multiprocessing
 
 
 class ExcelToolsMain:
@@ -281,6 +282,7 @@ class ExcelToolsMain:
         
         # 清理工具实例
         if self.vlookup_tool:
+            self.vlookup_tool.engine.close()  # 删除引擎的临时索引文件
             self.vlookup_tool = None
         if self.datefilter_tool:
             self.datefilter_tool = None
@@ -409,5 +411,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包成exe后多进程查找需要
+    multiprocessing.freeze_support()
     main()
 
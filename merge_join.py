@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归并连接查找
+主表和参考表都已按键排序时，按键顺序同时流式读取两边，不构建参考表索引，内存占用与参考表行数无关
+"""
+from multimap_index import join_records, count_record
+
+
+class NotSortedError(ValueError):
+    """输入没有按键排序，无法归并连接"""
+
+
+class MergeJoinSource:
+    """归并连接使用的参考表来源，代替查找字典传给引擎
+
+    open_rows每次调用返回一个新的参考表行迭代器，行为规范化后的(键列..., 结果列...)。
+    """
+
+    def __init__(self, ref_path, search_column, result_column, open_rows, key_count, result_count,
+                 policy="last"):
+        self.ref_path = ref_path
+        self.search_column = search_column
+        self.result_column = result_column
+        self.open_rows = open_rows
+        self.key_count = key_count
+        self.result_count = result_count
+        self.policy = policy
+        self.duplicate_keys = {}  # 最近一次扫描得到的重复键汇总
+        self.entry_count = 0
+        self.fallback_index = None  # 输入未排序、退回哈希查找时使用的索引
+
+    def __len__(self):
+        return self.entry_count
+
+    def iter_groups(self, sort_key):
+        """按键分组流式读取参考表，返回(排序键, 查找键, 该键全部记录)；发现键逆序时抛出NotSortedError"""
+        duplicate_keys = {}
+        entry_count = 0
+        current_sort_key = None
+        current_key = None
+        records = []
+        for row in self.open_rows():
+            key = row[0] if self.key_count == 1 else tuple(row[:self.key_count])
+            record = row[self.key_count] if self.result_count == 1 else tuple(row[self.key_count:])
+            row_sort_key = sort_key(key)
+            if records and row_sort_key == current_sort_key:
+                records.append(record)
+                continue
+            if records:
+                if row_sort_key < current_sort_key:
+                    raise NotSortedError(f"参考表没有按键排序: {current_key} 之后出现 {key}")
+                entry_count += 1
+                if len(records) > 1:
+                    duplicate_keys[current_key] = len(records)
+                yield current_sort_key, current_key, records
+            current_sort_key, current_key, records = row_sort_key, key, [record]
+        if records:
+            entry_count += 1
+            if len(records) > 1:
+                duplicate_keys[current_key] = len(records)
+            yield current_sort_key, current_key, records
+        self.duplicate_keys = duplicate_keys
+        self.entry_count = entry_count
+
+
+def natural_sort_key(key):
+    """数值按大小、文本按字典序的排序键，数值排在文本之前；原文本作为并列时的区分"""
+    if isinstance(key, tuple):
+        return tuple(natural_sort_key(part) for part in key)
+    try:
+        return 0, float(key), key
+    except ValueError:
+        return 1, 0.0, key
+
+
+def text_sort_key(key):
+    """纯文本字典序的排序键"""
+    return key
+
+
+def choose_sort_key(keys):
+    """判断查找键按哪种顺序排序，返回对应的排序键函数；都不是时抛出NotSortedError"""
+    for sort_key in (natural_sort_key, text_sort_key):
+        previous = None
+        for key in keys:
+            current = sort_key(key)
+            if previous is not None and current < previous:
+                break
+            previous = current
+        else:
+            return sort_key
+    raise NotSortedError("主表查找列没有按键排序")
+
+
+def resolve_records(records, policy):
+    """按重复键处理方式合并同一个键的记录"""
+    if policy == "first":
+        return records[0]
+    if policy == "last":
+        return records[-1]
+    if policy == "count":
+        return count_record(records[0], len(records))
+    return join_records(records)
+
+
+def merge_join_column(source, cell_values, extra_keys=None, not_found_value="-", report=None, normalizer=None):
+    """对一列已排序的查找值做归并连接，返回(结果列列表, 匹配数, 未找到数)
+
+    每个单元格最多一个查找值（含换行多值的列无法保证顺序），空单元格结果为空；
+    主表或参考表没有排序时抛出NotSortedError，调用方应退回哈希查找。
+    normalizer为键规范化函数，应与生成参考表行时使用的一致。
+    report记录查找键时，扫描中顺带把没有被本列命中的参考表键写入report.unmatched_reference_keys。
+    """
+    result_count = source.result_count
+    row_count = len(cell_values)
+    positions = []
+    keys = []
+    for i, cell_value in enumerate(cell_values):
+        if cell_value is None:
+            continue
+        values = [value for value in map(normalizer or str.strip, str(cell_value).split('\n')) if value]
+        if not values:
+            continue
+        if len(values) > 1:
+            raise NotSortedError("查找列包含换行多值单元格，无法归并连接")
+        positions.append(i)
+        keys.append((values[0],) + extra_keys[i] if extra_keys else values[0])
+
+    sort_key = choose_sort_key(keys)
+    result_columns = [[""] * row_count for _ in range(result_count)]
+    row_matched = [False] * row_count
+    key_found = []
+    unmatched_keys = [] if report is not None and report.track_keys else None
+    matched_count = 0
+    not_found_count = 0
+
+    groups = source.iter_groups(sort_key)
+    group = next(groups, None)
+    group_hit = False  # 当前参考表键是否被命中过
+    for i, key in zip(positions, keys):
+        key_sort = sort_key(key)
+        while group is not None and group[0] < key_sort:
+            if unmatched_keys is not None and not group_hit:
+                unmatched_keys.append(group[1])
+            group = next(groups, None)
+            group_hit = False
+
+        record = None
+        if group is not None and group[0] == key_sort:
+            record = resolve_records(group[2], source.policy)
+            if result_count == 1:
+                record = (record,) if record != "" else None
+
+        key_found.append(record is not None)
+        if record is not None:
+            group_hit = True
+            matched_count += 1
+            row_matched[i] = True
+            for column, value in zip(result_columns, record):
+                column[i] = value if value != "" else not_found_value
+        else:
+            not_found_count += 1
+            for column in result_columns:
+                column[i] = not_found_value
+
+    # 读完参考表剩余部分，确认整体有序并得到完整的重复键汇总
+    if unmatched_keys is not None and group is not None and not group_hit:
+        unmatched_keys.append(group[1])
+    for group in groups:
+        if unmatched_keys is not None:
+            unmatched_keys.append(group[1])
+
+    # 全部成功后才写入报告，中途退回哈希查找时不会重复统计
+    if report is not None:
+        report.add_rows(row_matched)
+        if report.track_keys:
+            for key, found in zip(keys, key_found):
+                report.add_key(key, found)
+            report.unmatched_reference_keys = unmatched_keys
+    return result_columns, matched_count, not_found_count
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存映射查找索引
+把查找字典写成只读的哈希表文件（有序键哈希、偏移数组、字符串堆），
+多个进程以内存映射方式打开同一文件，共享操作系统页缓存，不必各自反序列化一份字典
+"""
+import hashlib
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from sqlite_lookup import encode_key_value, decode_key
+
+MAGIC = b"XTMMAP01"
+HEADER = struct.Struct("<8sQQQQ")  # 标识, 记录数, 键列数, 结果列数, 字符串堆字节数
+
+
+def key_hash(encoded_key):
+    """键的64位哈希；Python内置hash每个进程随机化，不能写入文件，这里用blake2b"""
+    return int.from_bytes(hashlib.blake2b(encoded_key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class MmapLookupIndex:
+    """基于内存映射文件的只读查找索引，接口与查找字典一致（get/get_many/keys/items/len）
+
+    文件依次为：文件头、按哈希排序的键哈希uint64[n]、插入顺序int64[n]（第i个插入的记录在排序后的位置）、
+    偏移int64[n * (1 + 结果列数) + 1]、字符串堆。每条记录在堆中依次存放编码后的键和各结果列，
+    查找时二分定位哈希，再比较堆中的键排除哈希冲突。
+    对象被pickle时只传文件路径，子进程重新映射同一文件，索引数据不会被复制。
+    """
+
+    prefer_batch = True  # 单个查找需要计算哈希和二分，引擎应整列批量查找
+
+    def __init__(self, path):
+        self.path = path
+        self._open()
+
+    def _open(self):
+        with open(self.path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, entry_count, key_count, result_count, heap_size = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.mm.close()
+            raise ValueError(f"不是有效的内存映射索引文件: {self.path}")
+        self.entry_count = entry_count
+        self.key_count = key_count
+        self.result_count = result_count
+        self.fields = 1 + result_count  # 每条记录在堆中的片段数
+
+        offset = HEADER.size
+        self.hashes = np.frombuffer(self.mm, dtype=np.uint64, count=entry_count, offset=offset)
+        offset += entry_count * 8
+        self.order = np.frombuffer(self.mm, dtype=np.int64, count=entry_count, offset=offset)
+        offset += entry_count * 8
+        self.offsets = np.frombuffer(self.mm, dtype=np.int64, count=entry_count * self.fields + 1, offset=offset)
+        offset += (entry_count * self.fields + 1) * 8
+        self.heap_start = offset
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    @classmethod
+    def build(cls, path, lookup_dict):
+        """把查找字典写入索引文件（先写临时文件再替换），返回打开的索引"""
+        keys = [encode_key_value(key) for key in lookup_dict]
+        sample_key = next(iter(lookup_dict), "")
+        key_count = len(sample_key) if isinstance(sample_key, tuple) else 1
+        sample_record = next(iter(lookup_dict.values()), "")
+        result_count = len(sample_record) if isinstance(sample_record, tuple) else 1
+
+        hashes = np.fromiter((key_hash(key) for key in keys), dtype=np.uint64, count=len(keys))
+        sorted_positions = np.argsort(hashes, kind="stable")
+        order = np.empty(len(keys), dtype=np.int64)
+        order[sorted_positions] = np.arange(len(keys), dtype=np.int64)
+
+        records = list(lookup_dict.values())
+        pieces = []
+        for position in sorted_positions.tolist():
+            record = records[position]
+            pieces.append(keys[position].encode("utf-8"))
+            if result_count == 1:
+                pieces.append(str(record).encode("utf-8"))
+            else:
+                pieces.extend(str(field).encode("utf-8") for field in record)
+        offsets = np.zeros(len(pieces) + 1, dtype=np.int64)
+        np.cumsum([len(piece) for piece in pieces], out=offsets[1:])
+
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, len(keys), key_count, result_count, int(offsets[-1])))
+                f.write(hashes[sorted_positions].tobytes())
+                f.write(order.tobytes())
+                f.write(offsets.tobytes())
+                for piece in pieces:
+                    f.write(piece)
+        except Exception:
+            # 写入失败时删除临时文件
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        os.replace(temp_path, path)
+        return cls(path)
+
+    def close(self):
+        # 先释放numpy视图，否则映射无法关闭
+        self.hashes = self.order = self.offsets = None
+        self.mm.close()
+
+    def __len__(self):
+        return self.entry_count
+
+    def _piece(self, index):
+        start = self.heap_start + int(self.offsets[index])
+        end = self.heap_start + int(self.offsets[index + 1])
+        return self.mm[start:end].decode("utf-8")
+
+    def _record(self, position):
+        base = position * self.fields
+        if self.result_count == 1:
+            return self._piece(base + 1)
+        return tuple(self._piece(base + 1 + i) for i in range(self.result_count))
+
+    def _find(self, encoded_key, hash_value, position):
+        """从哈希的第一个位置开始，返回键一致的记录位置，不存在时返回-1"""
+        while position < self.entry_count and int(self.hashes[position]) == hash_value:
+            if self._piece(position * self.fields) == encoded_key:
+                return position
+            position += 1
+        return -1
+
+    def get(self, key, default=None):
+        encoded_key = encode_key_value(key)
+        hash_value = key_hash(encoded_key)
+        position = int(np.searchsorted(self.hashes, np.uint64(hash_value), side="left"))
+        position = self._find(encoded_key, hash_value, position)
+        return default if position < 0 else self._record(position)
+
+    def get_many(self, keys):
+        """批量查找，整批哈希一次searchsorted，返回与keys逐个对应的记录列表（未找到为None）"""
+        encoded_keys = [encode_key_value(key) for key in keys]
+        hash_values = np.fromiter((key_hash(key) for key in encoded_keys), dtype=np.uint64, count=len(keys))
+        positions = np.searchsorted(self.hashes, hash_values, side="left")
+        results = []
+        for encoded_key, hash_value, position in zip(encoded_keys, hash_values.tolist(), positions.tolist()):
+            position = self._find(encoded_key, hash_value, position)
+            results.append(None if position < 0 else self._record(position))
+        return results
+
+    def keys(self):
+        """按写入时查找字典的顺序遍历键"""
+        for position in self.order.tolist():
+            yield decode_key(self._piece(position * self.fields), self.key_count)
+
+    def items(self):
+        for position in self.order.tolist():
+            yield decode_key(self._piece(position * self.fields), self.key_count), self._record(position)
+
+
+def benchmark_shared_index(entry_counts=(100000, 1000000), workers=2):
+    """比较pickle字典与内存映射索引传给并行子进程的开销，返回{记录数: 统计字典}
+
+    统计项：每个子进程收到的序列化字节数、进程池启动到每个进程完成一次查找的耗时。
+    进程池使用spawn方式启动（Windows上的默认方式），索引必须序列化后传给子进程。
+    """
+    import multiprocessing
+    import pickle
+    import tempfile
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+    from vlookup_engine import init_lookup_worker, lookup_chunk
+
+    results = {}
+    for entry_count in entry_counts:
+        lookup_dict = {str(i): (f"name{i}", str(i * 3)) for i in range(entry_count)}
+        path = os.path.join(tempfile.gettempdir(), f"excel_tools_benchmark_{os.getpid()}.mmap")
+        start = time.perf_counter()
+        index = MmapLookupIndex.build(path, lookup_dict)
+        build_seconds = time.perf_counter() - start
+
+        stats = {"mmap_build_seconds": build_seconds}
+        tasks = [([str(i), "missing"], None, 2, None) for i in range(workers)]
+        for name, shared in (("pickle", lookup_dict), ("mmap", index)):
+            stats[f"{name}_payload_bytes"] = len(pickle.dumps(shared, protocol=pickle.HIGHEST_PROTOCOL))
+            start = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=init_lookup_worker, initargs=(shared, "-", True)) as executor:
+                outputs = list(executor.map(lookup_chunk, tasks))
+            stats[f"{name}_startup_seconds"] = time.perf_counter() - start
+            assert outputs[0][0][0] == ["name0", "-"], outputs[0]
+
+        index.close()
+        os.remove(path)
+        results[entry_count] = stats
+    return results
+
+
+if __name__ == "__main__":
+    for entry_count, stats in benchmark_shared_index().items():
+        print(f"{entry_count} 条记录: 构建映射文件 {stats['mmap_build_seconds']:.2f}s")
+        for name in ("pickle", "mmap"):
+            print(f"  {name}: 每个进程传输 {stats[f'{name}_payload_bytes'] / 1024 / 1024:.1f}MB, "
+                  f"启动并完成查找 {stats[f'{name}_startup_seconds']:.2f}s")
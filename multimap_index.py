@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+参考表多值索引
+参考表中同一个键出现多次时保留全部记录，再按重复键处理方式生成查找字典；
+保留第一条/最后一条时不需要全部记录，直接构建普通查找字典
+"""
+from array import array
+from collections import Counter
+import numpy as np
+
+# 重复键处理方式
+DUPLICATE_POLICIES = {
+    "last": "保留最后一条",
+    "first": "保留第一条",
+    "all": "全部（换行合并）",
+    "count": "计数",
+}
+
+
+class MultiMap:
+    """紧凑的多值映射：所有记录按键分组存放在一个扁平列表中
+
+    keys[i]的记录为records[offsets[i]:offsets[i + 1]]，组内保持参考表中的行顺序。
+    """
+
+    def __init__(self, keys, offsets, records, key_ids=None):
+        self.keys = keys
+        self.offsets = offsets
+        self.records = records
+        self._key_ids = key_ids  # 键 -> 编号，get_all第一次调用时才生成
+
+    @property
+    def key_ids(self):
+        if self._key_ids is None:
+            self._key_ids = {key: key_id for key_id, key in enumerate(self.keys)}
+        return self._key_ids
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_all(self, key):
+        """返回某个键的全部记录，不存在时返回空列表"""
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            return []
+        return self.records[self.offsets[key_id]:self.offsets[key_id + 1]]
+
+    def counts(self):
+        """每个键的记录数"""
+        return np.diff(self.offsets)
+
+    def duplicate_keys(self):
+        """重复键汇总：{键: 出现次数}，只包含出现多于一次的键"""
+        counts = self.counts()
+        return {self.keys[i]: int(counts[i]) for i in np.flatnonzero(counts > 1).tolist()}
+
+    def resolve(self, policy="last"):
+        """按重复键处理方式生成普通查找字典"""
+        if policy not in DUPLICATE_POLICIES:
+            raise ValueError(f"不支持的重复键处理方式: {policy}")
+        offsets = self.offsets.tolist()
+        records = self.records
+        if policy == "first":
+            return {key: records[offsets[i]] for i, key in enumerate(self.keys)}
+        if policy == "last":
+            return {key: records[offsets[i + 1] - 1] for i, key in enumerate(self.keys)}
+        if policy == "count":
+            return {key: count_record(records[offsets[i]], offsets[i + 1] - offsets[i])
+                    for i, key in enumerate(self.keys)}
+        return {key: join_records(records[offsets[i]:offsets[i + 1]]) for i, key in enumerate(self.keys)}
+
+
+class DictBuilder:
+    """保留第一条/最后一条时使用：一次遍历直接写入普通查找字典，重复键只计数，被替换的记录不保留"""
+
+    def __init__(self, policy="last"):
+        self.keep_first = policy == "first"
+        self.lookup_dict = {}
+        self.extra_counts = Counter()  # 重复键 -> 多出现的次数
+
+    def add(self, key, record):
+        if key in self.lookup_dict:
+            self.extra_counts[key] += 1
+            if self.keep_first:
+                return
+        self.lookup_dict[key] = record
+
+    def finish(self):
+        """返回(查找字典, 重复键汇总{键: 出现次数})"""
+        duplicate_keys = {key: count + 1 for key, count in self.extra_counts.items()}
+        return self.lookup_dict, duplicate_keys
+
+
+class MultiMapBuilder:
+    """一次遍历收集(键, 记录)，重复键不覆盖；build时用计数排序按键分组"""
+
+    def __init__(self, policy="all"):
+        self.policy = policy
+        self.key_ids = {}  # 键 -> 编号（按首次出现顺序）
+        self.row_key_ids = array('q')  # 每行记录对应的键编号
+        self.records = []
+
+    def add(self, key, record):
+        key_id = self.key_ids.setdefault(key, len(self.key_ids))
+        self.row_key_ids.append(key_id)
+        self.records.append(record)
+
+    def build(self):
+        """生成MultiMap；构建器的键编号和记录交给MultiMap，构建器随后清空，不再保留第二份"""
+        row_key_ids = np.frombuffer(self.row_key_ids, dtype=np.int64) if self.row_key_ids else np.zeros(0, np.int64)
+        counts = np.bincount(row_key_ids, minlength=len(self.key_ids))
+        offsets = np.zeros(len(self.key_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        order = np.argsort(row_key_ids, kind="stable")  # 稳定排序，组内保持原行顺序
+        del row_key_ids
+        self.row_key_ids = array('q')
+        records, self.records = self.records, []
+        records = [records[i] for i in order.tolist()]
+        key_ids, self.key_ids = self.key_ids, {}
+        return MultiMap(list(key_ids), offsets, records, key_ids)
+
+    def finish(self):
+        """返回(查找字典, 重复键汇总{键: 出现次数})"""
+        multimap = self.build()
+        return multimap.resolve(self.policy), multimap.duplicate_keys()
+
+
+def create_builder(policy="last"):
+    """按重复键处理方式选择构建器：只有全部/计数需要保留每条记录"""
+    if policy not in DUPLICATE_POLICIES:
+        raise ValueError(f"不支持的重复键处理方式: {policy}")
+    if policy in ("first", "last"):
+        return DictBuilder(policy)
+    return MultiMapBuilder(policy)
+
+
+def join_records(records):
+    """多条记录按换行合并，多结果列时逐列合并；只有一条时原样返回"""
+    if len(records) == 1:
+        return records[0]
+    if isinstance(records[0], tuple):
+        return tuple('\n'.join(field for field in fields if field != "") for fields in zip(*records))
+    return '\n'.join(record for record in records if record != "")
+
+
+def count_record(sample, count):
+    """计数方式的记录：每个结果列都填出现次数"""
+    if isinstance(sample, tuple):
+        return (str(count),) * len(sample)
+    return str(count)
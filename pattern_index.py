@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+前缀匹配和包含匹配索引
+前缀匹配：参考表键是前缀（如产品编码前缀 -> 类别），用字典树找出查找值最长的前缀键；
+包含匹配：参考表键是关键词，用n元组倒排索引找出查找值中包含的最长关键词。
+两种查找的耗时都与查找值长度成正比，不需要逐个扫描参考表键
+"""
+
+# 匹配方式（近似匹配单独用区间索引实现）
+MATCH_MODES = {
+    "exact": "精确匹配",
+    "prefix": "前缀匹配（参考表键为前缀）",
+    "contains": "包含匹配（参考表键为关键词）",
+}
+
+NGRAM_SIZE = 2  # 包含匹配倒排索引的n元组长度，中文关键词通常不少于两个字
+_END = ""  # 字典树节点中记录编号的键，单个字符不会是空字符串
+
+
+def check_pattern_keys(lookup_dict, mode_label):
+    """前缀/包含匹配只支持单列文本键"""
+    for key in lookup_dict.keys():
+        if isinstance(key, tuple):
+            raise ValueError(f"{mode_label}不支持组合键，请只选择一个键列")
+        break
+
+
+class PrefixIndex:
+    """前缀匹配索引：参考表键组成字典树，查找时沿查找值逐字符下行，返回最长的前缀键对应的记录"""
+
+    def __init__(self):
+        self.root = {}
+        self.records = []
+
+    @classmethod
+    def from_lookup_dict(cls, lookup_dict):
+        """从精确匹配的查找字典构建字典树"""
+        check_pattern_keys(lookup_dict, "前缀匹配")
+        index = cls()
+        for key, record in lookup_dict.items():
+            if key:
+                index.add(key, record)
+        return index
+
+    def add(self, key, record):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        if _END in node:
+            self.records[node[_END]] = record  # 规范化后相同的键保留后出现的记录
+        else:
+            node[_END] = len(self.records)
+            self.records.append(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, key, default=None):
+        """返回key最长的前缀键对应的记录"""
+        if not isinstance(key, str):
+            return default
+        node = self.root
+        found = None
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(_END, found)
+        return default if found is None else self.records[found]
+
+
+class ContainsIndex:
+    """包含匹配索引：按关键词开头的n元组建立倒排表，记录以该n元组开头的关键词有哪些长度
+
+    查找时逐个位置取n元组，只按倒排表中的长度截取子串到关键词字典中核对，
+    不需要比较以同一n元组开头的每个关键词。多个关键词都出现在查找值中时返回最长的一个，
+    长度相同时取在查找值中最先出现的。短于n元组长度的关键词单独按首字符索引。
+    """
+
+    def __init__(self, ngram_size=NGRAM_SIZE):
+        self.ngram_size = ngram_size
+        self.postings = {}  # 开头的n元组（或短关键词的首字符） -> 关键词长度列表（降序）
+        self.records = []
+        self.keywords = {}  # 关键词 -> 记录编号
+
+    @classmethod
+    def from_lookup_dict(cls, lookup_dict, ngram_size=NGRAM_SIZE):
+        """从精确匹配的查找字典构建倒排索引"""
+        check_pattern_keys(lookup_dict, "包含匹配")
+        index = cls(ngram_size)
+        for key, record in lookup_dict.items():
+            if key:
+                index.add(key, record)
+        index.postings = {gram: sorted(lengths, reverse=True) for gram, lengths in index.postings.items()}
+        return index
+
+    def add(self, keyword, record):
+        record_id = self.keywords.get(keyword)
+        if record_id is not None:
+            self.records[record_id] = record  # 规范化后相同的关键词保留后出现的记录
+            return
+        self.keywords[keyword] = len(self.records)
+        self.records.append(record)
+        gram = keyword[:self.ngram_size] if len(keyword) >= self.ngram_size else keyword[0]
+        self.postings.setdefault(gram, set()).add(len(keyword))
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, key, default=None):
+        """返回key中包含的最长关键词对应的记录"""
+        if not isinstance(key, str):
+            return default
+        best_id = None
+        best_length = 0
+        n = self.ngram_size
+        for start in range(len(key)):
+            # 以该位置开头的n元组和单个字符（短关键词）分别取候选长度
+            grams = (key[start:start + n], key[start]) if n > 1 else (key[start],)
+            for gram in grams:
+                for length in self.postings.get(gram, ()):
+                    if length <= best_length:
+                        break  # 长度降序，后面的不会更长
+                    if start + length > len(key):
+                        continue
+                    record_id = self.keywords.get(key[start:start + length])
+                    if record_id is not None:
+                        best_id, best_length = record_id, length
+                        break
+        return default if best_id is None else self.records[best_id]
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+区间查找索引
+实现VLOOKUP近似匹配（VLOOKUP(...,TRUE)）：参考表键排序后用二分查找定位所在区间
+"""
+from datetime import date, datetime
+import numpy as np
+
+EXCEL_EPOCH = datetime(1899, 12, 30)  # Excel日期序列号的起点
+DATE_PARSE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%Y年%m月%d日', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d %H:%M:%S']
+
+
+def to_range_number(value):
+    """把数值、日期或其文本转换为可比较的浮点数，日期转换为Excel序列号，无法转换时返回None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+        return None if number != number else number  # NaN视为无法转换
+    if isinstance(value, datetime):
+        return (value - EXCEL_EPOCH).total_seconds() / 86400
+    if isinstance(value, date):
+        return float((value - EXCEL_EPOCH.date()).days)
+
+    text = str(value).strip()
+    if not text:
+        return None
+    try:
+        number = float(text)
+        return None if number != number else number
+    except ValueError:
+        pass
+    for fmt in DATE_PARSE_FORMATS:
+        try:
+            return to_range_number(datetime.strptime(text, fmt))
+        except ValueError:
+            continue
+    return None
+
+
+class RangeIndex:
+    """近似匹配索引：键为各区间下限，查找时返回不大于查找值的最大键对应的记录
+
+    键统一转换为浮点数（日期为Excel序列号）保存在有序numpy数组中，单个查找用二分查找，
+    get_many对整批查找值一次searchsorted。查找值小于最小键或不是数值/日期时视为未找到，
+    与Excel的VLOOKUP(...,TRUE)返回#N/A一致。
+    """
+
+    def __init__(self, keys, records):
+        order = np.argsort(keys, kind="stable")  # 键相同时保留参考表中靠后的记录
+        self.bounds = np.asarray(keys, dtype=np.float64)[order]
+        self.records = [records[i] for i in order.tolist()]
+        self.skipped = 0  # 无法转换为数值/日期而被忽略的键数
+
+    @classmethod
+    def from_lookup_dict(cls, lookup_dict):
+        """从精确匹配的查找字典构建区间索引"""
+        keys = []
+        records = []
+        for key, record in lookup_dict.items():
+            if isinstance(key, tuple):
+                raise ValueError("近似匹配不支持组合键，请只选择一个键列")
+            number = to_range_number(key)
+            if number is not None:
+                keys.append(number)
+                records.append(record)
+        index = cls(keys, records)
+        index.skipped = len(lookup_dict) - len(keys)
+        return index
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, key, default=None):
+        """返回key所在区间的记录"""
+        number = to_range_number(key)
+        if number is None:
+            return default
+        pos = int(np.searchsorted(self.bounds, number, side="right")) - 1
+        return self.records[pos] if pos >= 0 else default
+
+    def get_many(self, keys):
+        """批量查找，返回与keys逐个对应的记录列表（未找到为None）"""
+        numbers = [to_range_number(key) for key in keys]
+        valid = np.array([number is not None for number in numbers], dtype=bool)
+        values = np.array([number if number is not None else 0.0 for number in numbers], dtype=np.float64)
+        positions = np.searchsorted(self.bounds, values, side="right") - 1
+        return [self.records[pos] if ok and pos >= 0 else None
+                for ok, pos in zip(valid.tolist(), positions.tolist())]
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite磁盘查找索引
+参考表超过内存预算时，把索引流式写入本地SQLite文件，查找时按批用IN查询，配合小容量热点缓存
+"""
+import os
+import sqlite3
+from collections import OrderedDict
+
+from multimap_index import DUPLICATE_POLICIES
+
+KEY_SEPARATOR = "\x1f"  # 组合键各部分的分隔符（单元分隔符，不会出现在普通文本中）
+INSERT_BATCH_ROWS = 10000  # 构建时每批写入的行数
+QUERY_BATCH_KEYS = 500  # 每条IN查询的键个数，低于SQLite的参数个数上限
+ESTIMATED_ENTRY_BYTES = 250  # 内存索引中每条记录的大致开销（键、值字符串和字典槽位）
+ESTIMATED_FIELD_BYTES = 80  # 每多一个结果列的大致开销
+_MISSING = object()
+
+
+def estimate_index_bytes(row_count, result_count=1):
+    """估算在内存中构建查找字典需要的字节数"""
+    return row_count * (ESTIMATED_ENTRY_BYTES + ESTIMATED_FIELD_BYTES * max(0, result_count - 1))
+
+
+class SqliteLookupIndex:
+    """基于SQLite文件的只读查找索引，接口与查找字典一致（get/get_many/keys/items/len）
+
+    表lookup(key主键, cnt出现次数, v0..vN结果列)；重复键在写入时按处理方式合并，cnt同时给出重复键汇总。
+    keys/items按rowid即参考表中首次出现的顺序遍历，与查找字典的顺序一致。
+    对象可以被pickle传给并行查找的子进程，子进程会重新以只读方式打开同一文件。
+    """
+
+    prefer_batch = True  # 逐个查询代价高，引擎应整列批量查找
+
+    def __init__(self, db_path, hot_cache_size=50000):
+        self.db_path = db_path
+        self.hot_cache_size = hot_cache_size
+        self._connect()
+
+    def _connect(self):
+        self.conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        meta = dict(self.conn.execute("SELECT name, value FROM meta").fetchall())
+        self.key_count = int(meta["key_count"])
+        self.result_count = int(meta["result_count"])
+        self.policy = meta["policy"]
+        self.entry_count = int(meta["entry_count"])
+        self.hot_cache = OrderedDict()
+        value_columns = ", ".join(f"v{i}" for i in range(self.result_count))
+        self._select = f"SELECT key, cnt, {value_columns} FROM lookup"
+
+    def __getstate__(self):
+        return {"db_path": self.db_path, "hot_cache_size": self.hot_cache_size}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._connect()
+
+    @classmethod
+    def open_existing(cls, db_path, hot_cache_size=50000):
+        """打开已构建完成的索引文件，文件不存在或未构建完成时返回None"""
+        if not os.path.exists(db_path):
+            return None
+        try:
+            index = cls(db_path, hot_cache_size)
+        except (sqlite3.Error, KeyError):
+            return None
+        return index
+
+    @classmethod
+    def build(cls, db_path, rows, key_count, result_count, policy="last", hot_cache_size=50000):
+        """从(键列..., 结果列...)行迭代器流式构建索引文件，重复键按policy合并
+
+        rows中的键值和结果值应已规范化为字符串（键为None的行会被跳过）。
+        """
+        if policy not in DUPLICATE_POLICIES:
+            raise ValueError(f"不支持的重复键处理方式: {policy}")
+        temp_path = f"{db_path}.{os.getpid()}.tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        value_columns = [f"v{i}" for i in range(result_count)]
+        if policy == "last":
+            updates = [f"{column} = excluded.{column}" for column in value_columns]
+        elif policy == "all":
+            updates = [f"{column} = CASE WHEN excluded.{column} = '' THEN {column} "
+                       f"WHEN {column} = '' THEN excluded.{column} "
+                       f"ELSE {column} || char(10) || excluded.{column} END" for column in value_columns]
+        else:  # first和count只累加次数
+            updates = []
+        upsert = (f"INSERT INTO lookup (key, cnt, {', '.join(value_columns)}) "
+                  f"VALUES (?, 1, {', '.join('?' * result_count)}) "
+                  f"ON CONFLICT(key) DO UPDATE SET {', '.join(['cnt = cnt + 1'] + updates)}")
+
+        conn = sqlite3.connect(temp_path)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute(f"CREATE TABLE lookup (key TEXT PRIMARY KEY, cnt INTEGER, "
+                         f"{', '.join(f'{column} TEXT' for column in value_columns)})")
+            conn.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+
+            batch = []
+            for row in rows:
+                batch.append((encode_key(row[:key_count]),) + tuple(row[key_count:]))
+                if len(batch) >= INSERT_BATCH_ROWS:
+                    conn.executemany(upsert, batch)
+                    batch = []
+            if batch:
+                conn.executemany(upsert, batch)
+
+            entry_count = conn.execute("SELECT COUNT(*) FROM lookup").fetchone()[0]
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("key_count", str(key_count)), ("result_count", str(result_count)),
+                ("policy", policy), ("entry_count", str(entry_count)),
+            ])
+            conn.commit()
+        except Exception:
+            # 构建失败时删除临时文件，不在缓存目录留下半成品数据库
+            conn.close()
+            os.remove(temp_path)
+            raise
+        conn.close()
+
+        # 构建完成后再替换，中途失败不会留下半成品索引
+        os.replace(temp_path, db_path)
+        return cls(db_path, hot_cache_size)
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.entry_count
+
+    def _record(self, row):
+        """把查询结果行(key, cnt, v0..)转换为与查找字典一致的记录"""
+        if self.policy == "count":
+            values = (str(row[1]),) * self.result_count
+        else:
+            values = row[2:]
+        return values[0] if self.result_count == 1 else tuple(values)
+
+    def _remember(self, key, record):
+        self.hot_cache[key] = record
+        if len(self.hot_cache) > self.hot_cache_size:
+            self.hot_cache.popitem(last=False)
+
+    def get(self, key, default=None):
+        record = self.hot_cache.get(key, _MISSING)
+        if record is _MISSING:
+            row = self.conn.execute(f"{self._select} WHERE key = ?", (encode_key_value(key),)).fetchone()
+            record = self._record(row) if row is not None else None
+            self._remember(key, record)
+        else:
+            self.hot_cache.move_to_end(key)
+        return default if record is None else record
+
+    def get_many(self, keys):
+        """批量查找，热点缓存未命中的键按批用IN查询，返回与keys逐个对应的记录列表"""
+        results = [None] * len(keys)
+        pending = {}  # 编码后的键 -> 在keys中的位置列表
+        for i, key in enumerate(keys):
+            record = self.hot_cache.get(key, _MISSING)
+            if record is _MISSING:
+                pending.setdefault(encode_key_value(key), []).append(i)
+            else:
+                results[i] = record
+
+        encoded_keys = list(pending)
+        for start in range(0, len(encoded_keys), QUERY_BATCH_KEYS):
+            batch = encoded_keys[start:start + QUERY_BATCH_KEYS]
+            found = {}
+            query = f"{self._select} WHERE key IN ({', '.join('?' * len(batch))})"
+            for row in self.conn.execute(query, batch):
+                found[row[0]] = self._record(row)
+            for encoded in batch:
+                record = found.get(encoded)
+                positions = pending[encoded]
+                for i in positions:
+                    results[i] = record
+                self._remember(keys[positions[0]], record)
+        return results
+
+    def keys(self):
+        for (key,) in self.conn.execute("SELECT key FROM lookup ORDER BY rowid"):
+            yield decode_key(key, self.key_count)
+
+    def items(self):
+        for row in self.conn.execute(f"{self._select} ORDER BY rowid"):
+            yield decode_key(row[0], self.key_count), self._record(row)
+
+    def duplicate_keys(self):
+        """重复键汇总：{键: 出现次数}"""
+        return {decode_key(key, self.key_count): count
+                for key, count in self.conn.execute("SELECT key, cnt FROM lookup WHERE cnt > 1")}
+
+
+def encode_key(values):
+    """把键列值编码为SQLite主键文本"""
+    return values[0] if len(values) == 1 else KEY_SEPARATOR.join(values)
+
+
+def encode_key_value(key):
+    """把查找键（字符串或组合键元组）编码为SQLite主键文本"""
+    return KEY_SEPARATOR.join(key) if isinstance(key, tuple) else key
+
+
+def decode_key(text, key_count):
+    """把SQLite主键文本还原为查找键"""
+    return tuple(text.split(KEY_SEPARATOR)) if key_count > 1 else text
@@ -11,13 +11,14 @@ import os
 import time
 import threading
 import queue
-import xlwings as xw
 import sys
 import subprocess
-import openpyxl
-from openpyxl import load_workbook
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from excel_utils import ExcelUtils, DATE_FORMATS
+from vlookup_engine import VlookupEngine, JOIN_MODES
+from multimap_index import DUPLICATE_POLICIES
+from key_normalizer import KEY_NORMALIZATIONS
+from pattern_index import MATCH_MODES
+from lookup_cache import LookupIndexCache
 
 
 class VlookupTool:
@@ -48,13 +49,26 @@ class VlookupTool:
         self.file_b_path = tk.StringVar()
         self.output_file_path = None
         self.processing = False
-        self.xl_app = None
         self.selected_column = tk.StringVar(value="追加到最后一列")
         self.message_queue = queue.Queue()
         self.result_column = tk.StringVar(value="")
         self.not_found_value = "-"  # 找不到的值用"-"代替
-        self.batch_size = 500  # 批量处理的行数
-        self.thread_count = 4  # 并行处理线程数
+        self.batch_size = tk.IntVar(value=500)  # 并行查找时每个分块的行数
+        self.thread_count = tk.IntVar(value=min(4, os.cpu_count() or 1))  # 并行查找进程数
+        self.memory_budget = tk.IntVar(value=2048)  # 参考表索引内存预算（MB），超过时改用SQLite磁盘索引
+        self.index_cache = LookupIndexCache()  # 参考表索引磁盘缓存
+        self.selection_orders = {}  # 多选列表 -> 按点击先后记录的选中项序号
+        # 查找逻辑由无界面引擎完成，界面只负责收集参数和显示进度
+        self.engine = VlookupEngine(
+            not_found_value=self.not_found_value,
+            progress_callback=self.update_progress,
+            message_callback=self.add_message
+        )
+    
+    @property
+    def xl_app(self):
+        """当前引擎使用的Excel实例（用于中途停止时关闭）"""
+        return self.engine.xl_app
     
     def setup_message_queue(self):
         """设置消息队列处理"""
@@ -70,6 +84,7 @@ class VlookupTool:
         self.create_title_frame()
         self.create_file_selection_frame()
         self.create_column_selection_frame()
+        self.create_options_frame()
         self.create_action_frame()
         self.create_progress_frame()
         self.create_status_frame()
@@ -154,10 +169,147 @@ class VlookupTool:
                                               font=("微软雅黑", 10), state="readonly")
         self.result_column_combo.grid(row=1, column=3, sticky=tk.EW, pady=5)
         
+        # 组合键：两边附加键列按选择的先后顺序一一对应
+        tk.Label(column_frame, text="主表附加键列:", font=("微软雅黑", 10), 
+                bg='white').grid(row=2, column=0, sticky=tk.NW, pady=5)
+        
+        self.extra_key_a_list = self.create_multi_select(column_frame)
+        self.extra_key_a_list.grid(row=2, column=1, sticky=tk.EW, padx=(5, 20), pady=5)
+        
+        tk.Label(column_frame, text="参考表附加键列:", font=("微软雅黑", 10), 
+                bg='white').grid(row=2, column=2, sticky=tk.NW, pady=5)
+        
+        self.extra_key_b_list = self.create_multi_select(column_frame)
+        self.extra_key_b_list.grid(row=2, column=3, sticky=tk.EW, pady=5)
+        
+        # 主表其他列复用同一参考表索引查找
+        tk.Label(column_frame, text="主表附加查找列:", font=("微软雅黑", 10), 
+                bg='white').grid(row=3, column=0, sticky=tk.NW, pady=5)
+        
+        self.extra_lookup_list = self.create_multi_select(column_frame)
+        self.extra_lookup_list.grid(row=3, column=1, sticky=tk.EW, padx=(5, 20), pady=5)
+        
+        # 一次查找输出多个结果列
+        tk.Label(column_frame, text="参考表附加结果列:", font=("微软雅黑", 10), 
+                bg='white').grid(row=3, column=2, sticky=tk.NW, pady=5)
+        
+        self.extra_result_list = self.create_multi_select(column_frame)
+        self.extra_result_list.grid(row=3, column=3, sticky=tk.EW, pady=5)
+        
         # 刷新按钮
         refresh_btn = ttk.Button(column_frame, text="🔄 刷新列信息", command=self.refresh_columns,
                                style="Accent.TButton")
-        refresh_btn.grid(row=2, column=0, columnspan=4, pady=(5, 0))
+        refresh_btn.grid(row=4, column=0, columnspan=4, pady=(5, 0))
+    
+    def create_multi_select(self, parent):
+        """创建多选列名列表，记录各项被选中的先后顺序"""
+        listbox = tk.Listbox(parent, selectmode=tk.MULTIPLE, exportselection=False,
+                             height=3, font=("微软雅黑", 10))
+        self.selection_orders[listbox] = []
+        listbox.bind("<<ListboxSelect>>", lambda event: self.track_selection_order(listbox))
+        return listbox
+    
+    def track_selection_order(self, listbox):
+        """选中项变化时更新选择顺序：保留仍选中的项，新选中的项排在最后"""
+        selected = listbox.curselection()
+        order = [i for i in self.selection_orders[listbox] if i in selected]
+        order.extend(i for i in selected if i not in order)
+        self.selection_orders[listbox] = order
+    
+    def update_multi_select(self, listbox, values):
+        """更新多选列表的值"""
+        listbox.delete(0, tk.END)
+        for value in values:
+            listbox.insert(tk.END, value)
+        self.selection_orders[listbox] = []
+    
+    def get_multi_select(self, listbox):
+        """获取多选列表中选中的值（按选择的先后顺序）"""
+        self.track_selection_order(listbox)
+        return [listbox.get(i) for i in self.selection_orders[listbox]]
+    
+    def create_options_frame(self):
+        """创建处理选项区域"""
+        options_frame = ttk.LabelFrame(self.main_container, text="⚙️ 处理选项", padding=15)
+        options_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        lookup_row = ttk.Frame(options_frame)
+        lookup_row.pack(fill=tk.X)
+        output_row = ttk.Frame(options_frame)
+        output_row.pack(fill=tk.X, pady=(10, 0))
+        key_row = ttk.Frame(options_frame)
+        key_row.pack(fill=tk.X, pady=(10, 0))
+        
+        # 查找方式
+        self.vectorized = tk.BooleanVar(value=False)
+        ttk.Checkbutton(lookup_row, text="整列向量化查找（大数据量推荐）",
+                        variable=self.vectorized).pack(side=tk.LEFT)
+        
+        # 参考表索引缓存
+        self.use_cache = tk.BooleanVar(value=True)
+        ttk.Checkbutton(lookup_row, text="缓存参考表索引",
+                        variable=self.use_cache).pack(side=tk.LEFT, padx=(20, 0))
+        
+        # 近似匹配
+        self.approximate = tk.BooleanVar(value=False)
+        ttk.Checkbutton(lookup_row, text="近似匹配（区间查找）",
+                        variable=self.approximate).pack(side=tk.LEFT, padx=(20, 0))
+        
+        # 归并连接
+        self.merge_join = tk.BooleanVar(value=False)
+        ttk.Checkbutton(lookup_row, text="归并连接（输入已按键排序）",
+                        variable=self.merge_join).pack(side=tk.LEFT, padx=(20, 0))
+        
+        # 多进程并行查找
+        self.parallel = tk.BooleanVar(value=False)
+        ttk.Checkbutton(lookup_row, text="多进程并行查找",
+                        variable=self.parallel).pack(side=tk.LEFT, padx=(20, 0))
+        
+        tk.Label(lookup_row, text="进程数:", font=("微软雅黑", 10)).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Spinbox(lookup_row, from_=2, to=64, width=4,
+                    textvariable=self.thread_count).pack(side=tk.LEFT, padx=(5, 0))
+        
+        tk.Label(lookup_row, text="分块行数:", font=("微软雅黑", 10)).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Spinbox(lookup_row, from_=100, to=1000000, increment=100, width=8,
+                    textvariable=self.batch_size).pack(side=tk.LEFT, padx=(5, 0))
+        
+        # 连接方式和未匹配报告
+        tk.Label(output_row, text="连接方式:", font=("微软雅黑", 10)).pack(side=tk.LEFT)
+        self.join_mode_combo = ttk.Combobox(output_row, values=list(JOIN_MODES.values()), width=14,
+                                            font=("微软雅黑", 10), state="readonly")
+        self.join_mode_combo.set(JOIN_MODES["left"])
+        self.join_mode_combo.pack(side=tk.LEFT, padx=(5, 0))
+        
+        # 参考表索引内存预算
+        tk.Label(output_row, text="内存预算(MB):", font=("微软雅黑", 10)).pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Spinbox(output_row, from_=0, to=65536, increment=256, width=6,
+                    textvariable=self.memory_budget).pack(side=tk.LEFT, padx=(5, 0))
+        
+        # 参考表重复键处理方式
+        tk.Label(output_row, text="重复键:", font=("微软雅黑", 10)).pack(side=tk.LEFT, padx=(20, 0))
+        self.duplicate_policy_combo = ttk.Combobox(output_row, values=list(DUPLICATE_POLICIES.values()),
+                                                   width=14, font=("微软雅黑", 10), state="readonly")
+        self.duplicate_policy_combo.set(DUPLICATE_POLICIES["last"])
+        self.duplicate_policy_combo.pack(side=tk.LEFT, padx=(5, 0))
+        
+        self.write_report = tk.BooleanVar(value=False)
+        ttk.Checkbutton(output_row, text="生成未匹配键报告（新增工作表）",
+                        variable=self.write_report).pack(side=tk.LEFT, padx=(20, 0))
+        
+        # 匹配方式
+        tk.Label(key_row, text="匹配方式:", font=("微软雅黑", 10)).pack(side=tk.LEFT)
+        self.match_mode_combo = ttk.Combobox(key_row, values=list(MATCH_MODES.values()), width=24,
+                                             font=("微软雅黑", 10), state="readonly")
+        self.match_mode_combo.set(MATCH_MODES["exact"])
+        self.match_mode_combo.pack(side=tk.LEFT, padx=(5, 0))
+        
+        # 键规范化：建索引和查找时各做一次，默认不启用
+        tk.Label(key_row, text="键规范化:", font=("微软雅黑", 10)).pack(side=tk.LEFT, padx=(20, 0))
+        self.key_normalization = {}
+        for mode, label in KEY_NORMALIZATIONS.items():
+            self.key_normalization[mode] = tk.BooleanVar(value=False)
+            ttk.Checkbutton(key_row, text=label,
+                            variable=self.key_normalization[mode]).pack(side=tk.LEFT, padx=(10, 0))
     
     def create_action_frame(self):
         """创建操作区域"""
@@ -273,6 +425,14 @@ class VlookupTool:
                             self.result_column_combo, columns_a, "主表结果列"
                         ))
                         
+                        self.window.after(0, lambda: self.update_multi_select(
+                            self.extra_key_a_list, columns_a
+                        ))
+                        
+                        self.window.after(0, lambda: self.update_multi_select(
+                            self.extra_lookup_list, columns_a
+                        ))
+                        
                     except Exception as e:
                         self.window.after(0, lambda: self.add_message(f"❌ 读取主表列名失败: {str(e)}", is_error=True))
                 
@@ -290,6 +450,14 @@ class VlookupTool:
                             self.column_result_combo, columns_b, "参考表结果"
                         ))
                         
+                        self.window.after(0, lambda: self.update_multi_select(
+                            self.extra_key_b_list, columns_b
+                        ))
+                        
+                        self.window.after(0, lambda: self.update_multi_select(
+                            self.extra_result_list, columns_b
+                        ))
+                        
                     except Exception as e:
                         self.window.after(0, lambda: self.add_message(f"❌ 读取参考表列名失败: {str(e)}", is_error=True))
                 
@@ -334,9 +502,9 @@ class VlookupTool:
             if not output_path:
                 return
                 
-            # 3. 使用优化的混合方案处理Excel（openpyxl + xlwings）
+            # 3. 处理Excel：快速模式只用openpyxl，标准模式使用xlwings
             # 用户可选择处理模式
-            if messagebox.askyesno("处理模式选择", "是否使用快速模式？\n\n快速模式：使用openpyxl进行数据查找，大幅提高处理速度\n标准模式：保持原有逻辑，保证格式完整性\n\n推荐使用快速模式，除非您需要保留非常复杂的格式"):
+            if messagebox.askyesno("处理模式选择", "是否使用快速模式？\n\n快速模式：只使用openpyxl查找和设置格式，不需要启动Excel，大幅提高处理速度\n标准模式：通过Excel处理，保证格式完整性\n\n推荐使用快速模式，除非您需要保留非常复杂的格式"):
                 self.process_with_hybrid_mode(output_path)
             else:
                 self.process_with_xlwings(output_path)
@@ -367,6 +535,18 @@ class VlookupTool:
         if not all([self.column_a_combo.get(), self.column_b_combo.get(), self.column_result_combo.get()]):
             self.window.after(0, lambda: messagebox.showwarning("警告", "请选择所有必需的列"))
             return False
+        
+        if len(self.get_multi_select(self.extra_key_a_list)) != len(self.get_multi_select(self.extra_key_b_list)):
+            self.window.after(0, lambda: messagebox.showwarning("警告", "主表与参考表的附加键列数量必须一致"))
+            return False
+        
+        lookup_columns, search_columns = self.get_key_columns()
+        if len(set(lookup_columns)) != len(lookup_columns) or len(set(search_columns)) != len(search_columns):
+            self.window.after(0, lambda: messagebox.showwarning("警告", "同一列不能在组合键中重复使用（包括主键列）"))
+            return False
+        if len(lookup_columns) > 1:
+            pairs = "，".join(f"{lookup} ↔ {search}" for lookup, search in zip(lookup_columns, search_columns))
+            self.add_message(f"🔑 组合键按选择顺序配对: {pairs}")
             
         return True
     
@@ -381,449 +561,67 @@ class VlookupTool:
             
         return output_path
     
+    def get_key_columns(self):
+        """获取(主表键列, 参考表键列)，第一列为主键列，支持换行多值拆分"""
+        lookup_columns = [self.column_a_combo.get()] + self.get_multi_select(self.extra_key_a_list)
+        search_columns = [self.column_b_combo.get()] + self.get_multi_select(self.extra_key_b_list)
+        return lookup_columns, search_columns
+    
+    def get_result_columns(self):
+        """获取参考表结果列（主结果列 + 附加结果列，去重）"""
+        result_columns = [self.column_result_combo.get()]
+        for column in self.get_multi_select(self.extra_result_list):
+            if column not in result_columns:
+                result_columns.append(column)
+        return result_columns
+    
+    def get_extra_lookup_columns(self):
+        """获取主表附加查找列（排除主键列本身）"""
+        return [column for column in self.get_multi_select(self.extra_lookup_list)
+                if column != self.column_a_combo.get()]
+    
+    def apply_engine_options(self):
+        """把界面选项同步到引擎"""
+        self.engine.vectorized = self.vectorized.get()
+        self.engine.cache = self.index_cache if self.use_cache.get() else None
+        self.engine.approximate = self.approximate.get()
+        self.engine.merge_join = self.merge_join.get()
+        self.engine.match_mode = next(mode for mode, label in MATCH_MODES.items()
+                                      if label == self.match_mode_combo.get())
+        self.engine.key_normalization = tuple(mode for mode, var in self.key_normalization.items() if var.get())
+        self.engine.join_mode = next(mode for mode, label in JOIN_MODES.items()
+                                     if label == self.join_mode_combo.get())
+        self.engine.write_report = self.write_report.get()
+        self.engine.duplicate_policy = next(policy for policy, label in DUPLICATE_POLICIES.items()
+                                            if label == self.duplicate_policy_combo.get())
+        try:
+            self.engine.workers = max(1, self.thread_count.get()) if self.parallel.get() else 1
+            self.engine.chunk_size = max(1, self.batch_size.get())
+            self.engine.memory_budget_mb = max(0, self.memory_budget.get())
+        except tk.TclError:
+            raise ValueError("进程数、分块行数和内存预算必须是整数")
+    
     def process_with_xlwings(self, output_path):
         """使用xlwings处理Excel"""
-        start_time = time.time()
-        self.add_message("="*50)
-        self.add_message("开始执行VLOOKUP操作...")
-        
-        app = xw.App(visible=False)
-        self.xl_app = app  # 保存引用以便关闭
-        
-        try:
-            # 1. 读取参考表数据 (20%)
-            self.update_progress(20, "正在读取参考表数据...")
-            wb_ref = app.books.open(self.file_b_path.get())
-            lookup_dict = self.build_lookup_dict(wb_ref)
-            wb_ref.close()
-            
-            # 2. 处理主表 (50%)
-            self.update_progress(50, "正在处理主表...")
-            wb_main = app.books.open(self.file_a_path.get())
-            self.process_main_table_fast(wb_main, lookup_dict)
-            
-            # 3. 保存结果 (100%)
-            self.update_progress(100, f"正在保存到: {os.path.basename(output_path)}")
-            wb_main.save(output_path)
-            wb_main.close()
-            
-            self.output_file_path = output_path
-            
-            # 4. 计算耗时
-            elapsed_time = time.time() - start_time
-            self.add_message(f"✅ 处理完成！耗时 {elapsed_time:.2f}秒")
-            self.add_message(f"📁 结果文件: {os.path.basename(output_path)}")
-            self.add_message("="*50)
-            
-        except Exception as e:
-            self.update_progress(0, f"处理失败: {str(e)}")
-            raise e
-        finally:
-            app.quit()
-            self.xl_app = None
+        self.apply_engine_options()
+        lookup_columns, search_columns = self.get_key_columns()
+        self.engine.run_xlwings(
+            self.file_a_path.get(), self.file_b_path.get(),
+            lookup_columns, search_columns, self.get_result_columns(),
+            output_path, self.result_column.get(), self.get_extra_lookup_columns()
+        )
+        self.output_file_path = output_path
     
     def process_with_hybrid_mode(self, output_path):
-        """使用混合模式处理Excel（openpyxl数据查找 + xlwings格式设置）"""
-        start_time = time.time()
-        self.add_message("="*50)
-        self.add_message("🚀 开始执行快速VLOOKUP操作（混合模式）...")
-        
-        try:
-            # 1. 使用openpyxl快速构建查找字典 (10%)
-            self.update_progress(10, "正在快速读取参考表数据...")
-            lookup_dict = self.build_lookup_dict_with_openpyxl()
-            
-            # 2. 使用openpyxl快速处理主表数据 (40%)
-            self.update_progress(40, "正在快速处理主表数据...")
-            temp_data_file = self.process_main_table_with_openpyxl(lookup_dict)
-            
-            # 3. 使用xlwings设置格式 (70%)
-            self.update_progress(70, "正在设置Excel格式...")
-            self.format_with_xlwings(temp_data_file, output_path)
-            
-            # 4. 清理临时文件
-            if os.path.exists(temp_data_file):
-                os.remove(temp_data_file)
-            
-            self.output_file_path = output_path
-            
-            # 5. 计算耗时 (100%)
-            elapsed_time = time.time() - start_time
-            self.update_progress(100, f"快速处理完成！耗时 {elapsed_time:.2f}秒")
-            self.add_message(f"⚡ 快速处理完成！耗时 {elapsed_time:.2f}秒")
-            self.add_message(f"📁 结果文件: {os.path.basename(output_path)}")
-            self.add_message("="*50)
-            
-        except Exception as e:
-            self.update_progress(0, f"快速处理失败: {str(e)}")
-            raise e
-    
-    def build_lookup_dict(self, wb_ref):
-        """构建查找字典 - 单线程版本（避免COM对象线程安全问题）"""
-        ws_ref = wb_ref.sheets[0]
-        
-        # 获取列索引
-        col_b_search = self.column_b_combo.get()
-        col_b_result = self.column_result_combo.get()
-        
-        # 读取表头
-        header = ws_ref.range('1:1').value
-        if not header:
-            raise ValueError("参考表没有表头")
-        
-        try:
-            search_col_idx = header.index(col_b_search) + 1
-            result_col_idx = header.index(col_b_result) + 1
-        except ValueError as e:
-            raise ValueError(f"参考表中未找到指定列: {e}")
-        
-        # 获取数据范围
-        last_row = ws_ref.range('A' + str(ws_ref.cells.last_cell.row)).end('up').row
-        if last_row < 2:
-            last_row = ws_ref.used_range.last_cell.row
-        
-        # 单线程处理（避免COM对象线程安全问题）
-        lookup_dict = {}
-        
-        # 一次性读取所有数据，避免多线程冲突
-        search_range = ws_ref.range(f"{chr(64 + search_col_idx)}2:{chr(64 + search_col_idx)}{last_row}")
-        result_range = ws_ref.range(f"{chr(64 + result_col_idx)}2:{chr(64 + result_col_idx)}{last_row}")
-        
-        search_values = search_range.value
-        result_values = result_range.value
-        
-        # 确保返回的是列表
-        if not isinstance(search_values, list):
-            search_values = [search_values]
-        if not isinstance(result_values, list):
-            result_values = [result_values]
-        
-        # 单线程处理数据
-        for i in range(len(search_values)):
-            search_value = search_values[i]
-            result_value = result_values[i] if i < len(result_values) else None
-            
-            if search_value is not None:
-                key = str(search_value).strip()
-                if result_value is not None:
-                    lookup_dict[key] = str(result_value).strip()
-                else:
-                    lookup_dict[key] = ""
-        
-        self.add_message(f"✅ 参考表数据加载完成，共 {len(lookup_dict)} 条记录")
-        return lookup_dict
-    
-    def process_main_table_fast(self, wb_main, lookup_dict):
-        """处理主表数据 - 单线程版本（避免COM对象线程安全问题）"""
-        ws_main = wb_main.sheets[0]
-        
-        # 获取列索引
-        col_a_lookup = self.column_a_combo.get()
-        
-        # 读取表头
-        header_main = ws_main.range('1:1').value
-        if not header_main:
-            raise ValueError("主表没有表头")
-        
-        try:
-            lookup_col_idx = header_main.index(col_a_lookup) + 1
-        except ValueError:
-            raise ValueError(f"主表中未找到列: {col_a_lookup}")
-        
-        # 获取数据范围
-        last_row_main = ws_main.range('A' + str(ws_main.cells.last_cell.row)).end('up').row
-        if last_row_main < 2:
-            last_row_main = ws_main.used_range.last_cell.row
-        
-        # 确定新列位置
-        result_col = self.result_column.get()
-        if result_col:  # 如果选择了特定列
-            try:
-                new_col_idx = header_main.index(result_col) + 1
-            except ValueError:
-                raise ValueError(f"主表中未找到列: {result_col}")
-        else:  # 追加到最后一列
-            new_col_idx = len([h for h in header_main if h is not None]) + 1
-        
-        new_col_name = f"查找结果_{self.column_result_combo.get()}"
-        ws_main.cells(1, new_col_idx).value = new_col_name
-        
-        # 设置新列标题样式
-        header_cell = ws_main.cells(1, new_col_idx)
-        header_cell.api.Font.Bold = True
-        header_cell.api.Interior.Color = 0x4F81BD  # 蓝色背景
-        header_cell.api.Font.Color = 0xFFFFFF  # 白色字体
-        header_cell.api.HorizontalAlignment = -4108  # 居中
-        
-        # 单线程处理数据（避免COM对象线程安全问题）
-        self.add_message("🔄 正在处理多值查找...")
-        
-        # 一次性读取所有查找列数据
-        lookup_range = ws_main.range(f"{chr(64 + lookup_col_idx)}2:{chr(64 + lookup_col_idx)}{last_row_main}")
-        lookup_values = lookup_range.value
-        
-        # 确保返回的是列表
-        if not isinstance(lookup_values, list):
-            lookup_values = [lookup_values]
-        
-        # 单线程处理数据
-        matched_count = 0
-        not_found_count = 0
-        
-        # 批量处理，每100行更新一次进度
-        batch_size = 100
-        total_rows = len(lookup_values)
-        
-        for i in range(0, total_rows, batch_size):
-            end_idx = min(i + batch_size, total_rows)
-            
-            for j in range(i, end_idx):
-                row = j + 2  # 数据从第2行开始
-                cell_value = lookup_values[j]
-                
-                if cell_value is None:
-                    ws_main.cells(row, new_col_idx).value = ""
-                    continue
-                
-                # 处理多值查找（按换行符分隔）
-                str_value = str(cell_value)
-                values = [v.strip() for v in str_value.split('\n') if v.strip()]
-                
-                if not values:
-                    ws_main.cells(row, new_col_idx).value = ""
-                    continue
-                
-                # 对每个值进行查找
-                results = []
-                for val in values:
-                    result = lookup_dict.get(val)
-                    if result is None:
-                        # 尝试去除空格匹配
-                        result = lookup_dict.get(val.strip())
-                    
-                    if result is not None and result != "":
-                        results.append(result)
-                        matched_count += 1
-                    else:
-                        results.append(self.not_found_value)
-                        not_found_count += 1
-                
-                # 用换行符合并结果
-                final_result = '\n'.join(results)
-                ws_main.cells(row, new_col_idx).value = final_result
-            
-            # 更新进度
-            progress = int((i + batch_size) / total_rows * 50) + 50  # 50-100%范围
-            self.update_progress(progress, f"数据处理进度: {min(i + batch_size, total_rows)}/{total_rows} 行")
-        
-        # 批量设置格式
-        self.add_message("🔄 正在设置格式...")
-        if last_row_main > 1:
-            try:
-                # 设置数据单元格格式
-                data_range = ws_main.range(f"{chr(64 + new_col_idx)}2:{chr(64 + new_col_idx)}{last_row_main}")
-                data_range.api.WrapText = True
-                data_range.api.VerticalAlignment = -4108  # 居中
-                data_range.api.HorizontalAlignment = -4108  # 居中
-                
-                # 批量设置行高（优化性能）
-                # 使用批量操作替代逐行设置
-                if last_row_main - 1 > 1000:  # 大数据量时使用批量设置
-                    # 设置整个区域的行高
-                    rows_range = ws_main.range(f"2:{last_row_main}")
-                    rows_range.api.RowHeight = 50
-                else:
-                    # 小数据量时逐行设置
-                    for row in range(2, last_row_main + 1):
-                        ws_main.cells(row, new_col_idx).api.RowHeight = 50
-                        
-                self.add_message("✅ 格式设置完成")
-                
-            except Exception as e:
-                self.add_message(f"⚠️ 格式设置部分失败，但数据已处理完成: {str(e)}")
-                # 继续执行，不中断整个流程
-        
-        self.add_message(f"✅ 处理完成: 总行数 {total_rows}, 匹配成功 {matched_count}, 未找到 {not_found_count}")
-    
-    def build_lookup_dict_with_openpyxl(self):
-        """使用openpyxl快速构建查找字典"""
-        wb_ref = load_workbook(self.file_b_path.get(), data_only=True)
-        ws_ref = wb_ref.active
-        
-        # 获取列索引
-        col_b_search = self.column_b_combo.get()
-        col_b_result = self.column_result_combo.get()
-        
-        # 读取表头
-        header = [cell.value for cell in ws_ref[1]]
-        if not header:
-            raise ValueError("参考表没有表头")
-        
-        try:
-            search_col_idx = header.index(col_b_search) + 1
-            result_col_idx = header.index(col_b_result) + 1
-        except ValueError as e:
-            raise ValueError(f"参考表中未找到指定列: {e}")
-        
-        # 构建查找字典（单线程处理，确保稳定性）
-        lookup_dict = {}
-        max_row = ws_ref.max_row
-        
-        # 单线程处理数据
-        for row in range(2, max_row + 1):
-            search_value = ws_ref.cell(row=row, column=search_col_idx).value
-            result_value = ws_ref.cell(row=row, column=result_col_idx).value
-            
-            if search_value is not None:
-                key = str(search_value).strip()
-                if result_value is not None:
-                    lookup_dict[key] = str(result_value).strip()
-                else:
-                    lookup_dict[key] = ""
-        
-        wb_ref.close()
-        self.add_message(f"✅ 参考表数据加载完成，共 {len(lookup_dict)} 条记录")
-        return lookup_dict
-    
-    def process_main_table_with_openpyxl(self, lookup_dict):
-        """使用openpyxl快速处理主表数据"""
-        wb_main = load_workbook(self.file_a_path.get(), data_only=True)
-        ws_main = wb_main.active
-        
-        # 获取列索引
-        col_a_lookup = self.column_a_combo.get()
-        
-        # 读取表头
-        header_main = [cell.value for cell in ws_main[1]]
-        if not header_main:
-            raise ValueError("主表没有表头")
-        
-        try:
-            lookup_col_idx = header_main.index(col_a_lookup) + 1
-        except ValueError:
-            raise ValueError(f"主表中未找到列: {col_a_lookup}")
-        
-        # 确定新列位置
-        result_col = self.result_column.get()
-        if result_col:  # 如果选择了特定列
-            try:
-                new_col_idx = header_main.index(result_col) + 1
-            except ValueError:
-                raise ValueError(f"主表中未找到列: {result_col}")
-        else:  # 追加到最后一列
-            new_col_idx = len([h for h in header_main if h is not None]) + 1
-        
-        # 添加新列标题
-        new_col_name = f"查找结果_{self.column_result_combo.get()}"
-        ws_main.cell(row=1, column=new_col_idx).value = new_col_name
-        
-        # 单线程处理数据（确保稳定性）
-        max_row = ws_main.max_row
-        total_rows = max_row - 1
-        
-        self.add_message("🔄 正在处理数据...")
-        
-        # 单线程处理数据
-        for row in range(2, max_row + 1):
-            cell_value = ws_main.cell(row=row, column=lookup_col_idx).value
-            
-            if cell_value is None:
-                ws_main.cell(row=row, column=new_col_idx).value = ""
-                continue
-            
-            # 处理多值查找（按换行符分隔）
-            str_value = str(cell_value)
-            values = [v.strip() for v in str_value.split('\n') if v.strip()]
-            
-            if not values:
-                ws_main.cell(row=row, column=new_col_idx).value = ""
-                continue
-            
-            # 对每个值进行查找
-            results = []
-            for val in values:
-                result = lookup_dict.get(val)
-                if result is None:
-                    # 尝试去除空格匹配
-                    result = lookup_dict.get(val.strip())
-                
-                if result is not None and result != "":
-                    results.append(result)
-                else:
-                    results.append(self.not_found_value)
-            
-            # 用换行符合并结果
-            final_result = '\n'.join(results)
-            ws_main.cell(row=row, column=new_col_idx).value = final_result
-            
-            # 每100行更新一次进度
-            if (row - 1) % 100 == 0:
-                progress = int((row - 1) / total_rows * 30) + 40  # 40-70%范围
-                self.update_progress(progress, f"数据处理进度: {row - 1}/{total_rows} 行")
-        
-        # 保存临时文件
-        temp_file = f"temp_vlookup_{int(time.time())}.xlsx"
-        wb_main.save(temp_file)
-        wb_main.close()
-        
-        self.add_message(f"✅ 数据处理完成，共 {total_rows} 行数据")
-        return temp_file
-    
-    def format_with_xlwings(self, temp_file, output_path):
-        """使用xlwings设置格式"""
-        app = xw.App(visible=False)
-        
-        try:
-            wb = app.books.open(temp_file)
-            ws = wb.sheets[0]
-            
-            # 获取新列位置
-            header_main = ws.range('1:1').value
-            new_col_name = f"查找结果_{self.column_result_combo.get()}"
-            new_col_idx = header_main.index(new_col_name) + 1
-            
-            # 设置新列标题样式
-            header_cell = ws.cells(1, new_col_idx)
-            header_cell.api.Font.Bold = True
-            header_cell.api.Interior.Color = 0x4F81BD  # 蓝色背景
-            header_cell.api.Font.Color = 0xFFFFFF  # 白色字体
-            header_cell.api.HorizontalAlignment = -4108  # 居中
-            
-            # 设置数据单元格格式
-            max_row = ws.range('A' + str(ws.cells.last_cell.row)).end('up').row
-            if max_row < 2:
-                max_row = ws.used_range.last_cell.row
-            
-            # 批量设置格式
-            if max_row > 1:
-                try:
-                    data_range = ws.range(f"{chr(64 + new_col_idx)}2:{chr(64 + new_col_idx)}{max_row}")
-                    data_range.api.WrapText = True
-                    data_range.api.VerticalAlignment = -4108  # 居中
-                    data_range.api.HorizontalAlignment = -4108  # 居中
-                    
-                    # 批量设置行高（优化性能）
-                    if max_row - 1 > 1000:  # 大数据量时使用批量设置
-                        rows_range = ws.range(f"2:{max_row}")
-                        rows_range.api.RowHeight = 50
-                    else:
-                        # 小数据量时逐行设置
-                        for row in range(2, max_row + 1):
-                            ws.cells(row, new_col_idx).api.RowHeight = 50
-                except Exception as e:
-                    self.add_message(f"⚠️ 格式设置部分失败，但数据已处理完成: {str(e)}")
-                    # 继续执行，不中断整个流程
-            
-            # 保存最终文件
-            wb.save(output_path)
-            wb.close()
-            
-            self.add_message("✅ 格式设置完成")
-            
-        except Exception as e:
-            raise e
-        finally:
-            app.quit()
+        """使用快速模式处理Excel（openpyxl在内存中完成数据查找和格式设置，不启动Excel）"""
+        self.apply_engine_options()
+        lookup_columns, search_columns = self.get_key_columns()
+        self.engine.run_hybrid(
+            self.file_a_path.get(), self.file_b_path.get(),
+            lookup_columns, search_columns, self.get_result_columns(),
+            output_path, self.result_column.get(), self.get_extra_lookup_columns()
+        )
+        self.output_file_path = output_path
     
     def show_completion_message(self):
         """显示完成消息"""
@@ -869,6 +667,10 @@ class VlookupTool:
         self.column_b_combo.set("")
         self.column_result_combo.set("")
         self.result_column.set("")
+        self.update_multi_select(self.extra_key_a_list, [])
+        self.update_multi_select(self.extra_key_b_list, [])
+        self.update_multi_select(self.extra_lookup_list, [])
+        self.update_multi_select(self.extra_result_list, [])
         self.output_file_path = None
         self.open_result_btn.config(state=tk.DISABLED)
         
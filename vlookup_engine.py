@@ -0,0 +1,1248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Excel VLOOKUP 引擎
+不依赖图形界面的查找逻辑，可在批处理、子进程或性能分析中直接调用
+"""
+import os
+import re
+import time
+import tempfile
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from collections import Counter
+from copy import copy
+from itertools import compress, zip_longest
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.styles import Alignment, Font, PatternFill
+from excel_backend import XlwingsBackend, HEADER_STYLE, DATA_STYLE
+from range_index import RangeIndex
+from pattern_index import MATCH_MODES, PrefixIndex, ContainsIndex
+from multimap_index import create_builder, DUPLICATE_POLICIES
+from sqlite_lookup import SqliteLookupIndex, estimate_index_bytes
+from mmap_index import MmapLookupIndex
+from key_normalizer import KeyNormalizer
+from merge_join import MergeJoinSource, NotSortedError, merge_join_column
+
+
+class VlookupEngine:
+    """无界面的VLOOKUP引擎
+
+    输入文件路径、列名、未找到占位值和进度回调，输出结果工作簿或统计信息。
+    已加载的参考表索引会保留在引擎中，供多次主表处理复用。
+    """
+
+    def __init__(self, not_found_value="-", progress_callback=None, message_callback=None,
+                 vectorized=False, cache=None, workers=1, chunk_size=500, approximate=False,
+                 join_mode="left", write_report=False, duplicate_policy="last", memory_budget_mb=2048,
+                 merge_join=False, key_normalization=(), match_mode="exact"):
+        self.not_found_value = not_found_value  # 找不到的值用"-"代替
+        self.vectorized = vectorized  # 是否使用整列向量化查找
+        self.workers = workers  # 并行查找的进程数，1表示单进程
+        self.chunk_size = chunk_size  # 并行查找时每个分块的行数
+        self.approximate = approximate  # 是否使用近似匹配（区间查找）
+        self.match_mode = match_mode  # 精确/前缀/包含匹配，取值见MATCH_MODES
+        self.join_mode = join_mode  # 连接方式，取值见JOIN_MODES
+        self.write_report = write_report  # 是否输出未匹配键报告工作表
+        self.duplicate_policy = duplicate_policy  # 参考表重复键处理方式，取值见DUPLICATE_POLICIES
+        self.duplicate_keys = {}  # 最近一次构建索引时的重复键汇总 {键: 出现次数}
+        self.memory_budget_mb = memory_budget_mb  # 预计索引超过该大小时改用SQLite磁盘索引，0表示不限制
+        self.merge_join = merge_join  # 输入已按键排序时使用归并连接，不构建参考表索引
+        self.key_normalization = key_normalization  # 键规范化方式，取值见KEY_NORMALIZATIONS
+        self.cache = cache  # LookupIndexCache实例，None表示不使用磁盘缓存
+        self.progress_callback = progress_callback  # progress_callback(value, message)
+        self.message_callback = message_callback  # message_callback(msg, is_error)
+        self.lookup_dict = None
+        self.reference_signature = None
+        self.shared_index = None  # 并行查找时子进程共享的内存映射索引
+        self.shared_index_source = None  # 生成shared_index的查找字典
+        self.match_index = None  # 前缀/包含/近似匹配使用的索引，参考表和匹配方式不变时复用
+        self.match_index_source = None  # (查找字典, 参考表签名, 匹配方式, 是否近似匹配)
+        self.temp_dir = None  # 不使用缓存时存放SQLite索引和共享映射索引的临时目录，close时删除
+        self.xl_app = None
+
+    def add_message(self, msg, is_error=False):
+        """输出状态消息"""
+        if self.message_callback:
+            self.message_callback(msg, is_error)
+
+    def update_progress(self, value, message):
+        """输出进度"""
+        if self.progress_callback:
+            self.progress_callback(value, message)
+
+    @property
+    def key_normalization(self):
+        return self.normalizer.modes
+
+    @key_normalization.setter
+    def key_normalization(self, modes):
+        """设置键规范化方式时创建一次KeyNormalizer，整次运行共用"""
+        self.normalizer = KeyNormalizer(modes)
+
+    def temp_index_path(self, file_name):
+        """引擎临时目录中的索引文件路径，目录在首次使用时创建"""
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.TemporaryDirectory(prefix="excel_tools_")
+        return os.path.join(self.temp_dir.name, file_name)
+
+    def discard_index(self, index):
+        """关闭索引，索引文件在引擎临时目录中时一并删除"""
+        if not hasattr(index, "close"):
+            return
+        index.close()
+        path = getattr(index, "db_path", None) or getattr(index, "path", None)
+        if path and self.temp_dir is not None and os.path.dirname(path) == self.temp_dir.name:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def close(self):
+        """释放参考表索引和共享索引，删除引擎的临时文件；之后仍可继续使用，索引会重新加载"""
+        self.discard_index(self.lookup_dict)
+        self.lookup_dict = None
+        self.reference_signature = None
+        self.match_index = None
+        self.match_index_source = None
+        self.discard_index(self.shared_index)
+        self.shared_index = None
+        self.shared_index_source = None
+        if self.temp_dir is not None:
+            try:
+                self.temp_dir.cleanup()
+            except OSError:
+                pass
+            self.temp_dir = None
+
+    def load_reference(self, ref_path, search_column, result_column, reload=False, builder=None,
+                       source="openpyxl"):
+        """加载参考表索引
+
+        文件和列未变化时复用内存中的索引；启用磁盘缓存时优先读取缓存，
+        未命中再调用builder（默认使用openpyxl流式构建）并写入缓存。
+        默认流式构建时如果预计索引大小超过内存预算，改用SQLite磁盘索引；
+        命中的缓存按条目头部记录的条数同样检查内存预算，超过时不读入内存。
+        """
+        # 不同重复键处理方式、键规范化方式的索引分开缓存
+        source = f"{source}/{self.duplicate_policy}/{self.normalizer.tag}"
+        signature = (os.path.abspath(ref_path), os.path.getmtime(ref_path),
+                     tuple(as_column_list(search_column)), tuple(as_column_list(result_column)), source)
+        if not reload and self.lookup_dict is not None and signature == self.reference_signature:
+            self.add_message(f"♻️ 复用已加载的参考表索引，共 {len(self.lookup_dict)} 条记录")
+            return self.lookup_dict
+
+        self.discard_index(self.lookup_dict)  # 释放上一次的索引，临时磁盘索引文件一并删除
+        self.lookup_dict = None
+        self.match_index = None
+        self.match_index_source = None
+
+        # 先查缓存，命中时不需要打开参考表估算大小
+        lookup_dict = None
+        cache_key = None
+        over_budget = False
+        if self.cache is not None:
+            cache_key = self.cache.make_key(ref_path, search_column, result_column, source=source)
+            if not reload:
+                # 缓存是在调低内存预算之前写入的也可能超过预算，先按头部记录的条数检查
+                entry_count = self.cache.entry_count(cache_key)
+                if entry_count is not None and builder is None:
+                    over_budget = self.exceeds_memory_budget(ref_path, result_column, entry_count)
+                if not over_budget:
+                    lookup_dict = self.cache.load(cache_key)
+            if lookup_dict is not None:
+                self.add_message(f"⚡ 命中参考表索引缓存，共 {len(lookup_dict)} 条记录")
+
+        if over_budget or (lookup_dict is None and builder is None
+                           and self.exceeds_memory_budget(ref_path, result_column)):
+            lookup_dict = self.load_sqlite_index(ref_path, search_column, result_column, source, reload)
+            self.lookup_dict = lookup_dict
+            self.reference_signature = signature
+            return lookup_dict
+
+        if lookup_dict is None:
+            if cache_key is not None:
+                self.add_message("🔍 参考表索引缓存未命中，正在重新构建...")
+            if builder is None:
+                builder = lambda: self.build_lookup_dict_with_openpyxl(ref_path, search_column, result_column)
+            lookup_dict = builder()
+            if cache_key is not None:
+                try:
+                    self.cache.store(cache_key, lookup_dict)
+                    self.add_message("💾 参考表索引已写入缓存")
+                except OSError as e:
+                    self.add_message(f"⚠️ 写入索引缓存失败: {str(e)}")
+
+        self.lookup_dict = lookup_dict
+        self.reference_signature = signature
+        return lookup_dict
+
+    def exceeds_memory_budget(self, ref_path, result_column, row_count=None):
+        """按参考表行数估算内存索引大小，判断是否超过内存预算；row_count为已知的索引条数时不再读取参考表"""
+        if not self.memory_budget_mb:
+            return False
+        if row_count is None:
+            row_count = count_sheet_rows(ref_path)
+        estimated_mb = estimate_index_bytes(row_count, len(as_column_list(result_column))) / (1024 * 1024)
+        if estimated_mb <= self.memory_budget_mb:
+            return False
+        self.add_message(f"💽 参考表约 {row_count} 行，预计索引 {estimated_mb:.0f}MB，"
+                         f"超过内存预算 {self.memory_budget_mb}MB，改用SQLite磁盘索引")
+        return True
+
+    def load_sqlite_index(self, ref_path, search_column, result_column, source, reload=False):
+        """打开或构建SQLite磁盘索引；启用缓存时索引文件放在缓存目录中复用"""
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(ref_path, search_column, result_column, source=f"sqlite/{source}")
+            db_path = self.cache.sqlite_path(cache_key)
+            index = None if reload else SqliteLookupIndex.open_existing(db_path)
+            if index is not None:
+                self.cache.touch(cache_key)
+                self.add_message(f"⚡ 命中SQLite磁盘索引，共 {len(index)} 条记录")
+                return index
+        else:
+            db_path = self.temp_index_path("lookup.sqlite")
+
+        search_columns = as_column_list(search_column)
+        result_columns = as_column_list(result_column)
+        self.add_message("🔨 正在构建SQLite磁盘索引...")
+        index = SqliteLookupIndex.build(
+            db_path, iter_reference_rows(ref_path, search_columns, result_columns, self.normalizer),
+            len(search_columns), len(result_columns), self.duplicate_policy)
+        self.log_reference_summary(len(index), index.duplicate_keys())
+        if cache_key is not None:
+            self.cache.register(cache_key, self.cache.SQLITE_SUFFIX)
+        return index
+
+    def create_report(self, row_count):
+        """按连接方式和报告选项创建LookupReport，都不需要时返回None，查找不做额外统计"""
+        if self.join_mode not in JOIN_MODES:
+            raise ValueError(f"不支持的连接方式: {self.join_mode}")
+        if self.join_mode == "left" and not self.write_report:
+            return None
+        return LookupReport(row_count, track_keys=self.write_report)
+
+    def finish_reference_index(self, builder):
+        """由create_builder得到的构建器生成查找字典，并输出构建时顺带统计的重复键汇总"""
+        lookup_dict, duplicate_keys = builder.finish()
+        self.log_reference_summary(len(lookup_dict), duplicate_keys)
+        return lookup_dict
+
+    def log_reference_summary(self, entry_count, duplicate_keys):
+        """输出参考表记录数和重复键汇总"""
+        self.duplicate_keys = duplicate_keys
+        self.add_message(f"✅ 参考表数据加载完成，共 {entry_count} 条记录")
+        if self.duplicate_keys:
+            duplicate_rows = sum(self.duplicate_keys.values()) - len(self.duplicate_keys)
+            top_keys = sorted(self.duplicate_keys.items(), key=lambda item: -item[1])[:5]
+            self.add_message(f"⚠️ 参考表有 {len(self.duplicate_keys)} 个重复键（多出 {duplicate_rows} 行），"
+                             f"按“{DUPLICATE_POLICIES[self.duplicate_policy]}”处理")
+            self.add_message("   重复最多: " + ", ".join(f"{format_report_key(key)}×{count}"
+                                                        for key, count in top_keys))
+
+    def prepare_index(self, lookup_dict):
+        """按匹配方式准备查找索引：近似匹配时把参考表键排序成区间索引，前缀/包含匹配时构建字典树/倒排索引
+
+        构建的索引与参考表签名、匹配方式一起保存，复用同一个参考表索引时不再重新构建。
+        """
+        if self.match_mode not in MATCH_MODES:
+            raise ValueError(f"不支持的匹配方式: {self.match_mode}")
+        if self.approximate and self.match_mode != "exact":
+            raise ValueError("近似匹配不能与前缀匹配、包含匹配同时使用")
+        if self.match_mode == "exact" and not self.approximate:
+            return lookup_dict
+
+        source = (self.reference_signature, self.match_mode, self.approximate)
+        if (self.match_index is not None and self.match_index_source[0] is lookup_dict
+                and self.match_index_source[1:] == source):
+            self.add_message(f"♻️ 复用已构建的匹配索引，共 {len(self.match_index)} 个键")
+            return self.match_index
+        self.match_index = self.build_match_index(lookup_dict)
+        self.match_index_source = (lookup_dict,) + source
+        return self.match_index
+
+    def build_match_index(self, lookup_dict):
+        """构建前缀/包含/近似匹配使用的索引"""
+        if self.match_mode == "prefix":
+            index = PrefixIndex.from_lookup_dict(lookup_dict)
+            self.add_message(f"🌲 前缀匹配：共 {len(index)} 个前缀键")
+            return index
+        if self.match_mode == "contains":
+            index = ContainsIndex.from_lookup_dict(lookup_dict)
+            self.add_message(f"🔎 包含匹配：共 {len(index)} 个关键词")
+            return index
+
+        index = RangeIndex.from_lookup_dict(lookup_dict)
+        self.add_message(f"📐 近似匹配：共 {len(index)} 个区间下限")
+        if index.skipped:
+            self.add_message(f"⚠️ 已忽略 {index.skipped} 个不是数值或日期的参考表键")
+        return index
+
+    def lookup_cell(self, cell_value, lookup_dict, extra_key=(), result_count=1, report=None):
+        """对单元格做多值查找（按换行符分隔），返回(各结果列文本列表, 匹配数, 未找到数)
+
+        extra_key为组合键中其余键列的规范化值，与拆分出的每个查找值拼成元组键。
+        result_count大于1时索引值为多个结果列组成的记录元组，一次查找输出全部结果列。
+        传入report（LookupReport）时顺带记录每个查找键是否匹配。
+        """
+        if cell_value is None:
+            return [""] * result_count, 0, 0
+
+        # 未选择规范化方式时直接去除首尾空白，不经过KeyNormalizer
+        normalizer = self.normalizer
+        normalize = normalizer if normalizer.modes else str.strip
+        values = [value for value in map(normalize, str(cell_value).split('\n')) if value]
+        if not values:
+            return [""] * result_count, 0, 0
+
+        # 对每个值进行查找
+        columns = [[] for _ in range(result_count)]
+        matched_count = 0
+        not_found_count = 0
+        for val in values:
+            key = (val,) + extra_key if extra_key else val
+            record = lookup_dict.get(key)
+
+            if result_count == 1:
+                # 单结果列时索引值就是结果文本，空值视为未找到
+                record = (record,) if record is not None and record != "" else None
+
+            if report is not None and report.track_keys:
+                report.add_key(key, record is not None)
+
+            if record is not None:
+                matched_count += 1
+                for column, value in zip(columns, record):
+                    column.append(value if value != "" else self.not_found_value)
+            else:
+                not_found_count += 1
+                for column in columns:
+                    column.append(self.not_found_value)
+
+        # 用换行符合并结果
+        return ['\n'.join(column) for column in columns], matched_count, not_found_count
+
+    def lookup_column(self, cell_values, lookup_dict, extra_keys=None, result_count=1, report=None):
+        """对整列做多值查找，返回(结果列列表, 匹配数, 未找到数)
+
+        extra_keys为每行组合键其余部分组成的列表，单列键时为None；
+        返回的结果列列表包含result_count列，每列与cell_values逐行对应。
+        传入report时在同一次查找中记录每行是否有匹配以及各查找键的命中情况。
+        """
+        if self.vectorized or getattr(lookup_dict, "prefer_batch", False):
+            return vectorized_lookup(cell_values, lookup_dict, self.not_found_value, extra_keys, result_count,
+                                     report, self.normalizer)
+
+        result_columns = [[] for _ in range(result_count)]
+        row_matched = []
+        matched_count = 0
+        not_found_count = 0
+        for i, cell_value in enumerate(cell_values):
+            extra_key = extra_keys[i] if extra_keys else ()
+            row_results, matched, not_found = self.lookup_cell(
+                cell_value, lookup_dict, extra_key, result_count, report)
+            for column, value in zip(result_columns, row_results):
+                column.append(value)
+            row_matched.append(matched > 0)
+            matched_count += matched
+            not_found_count += not_found
+        if report is not None:
+            report.add_rows(row_matched)
+        return result_columns, matched_count, not_found_count
+
+    def lookup_main_columns(self, primary_columns, extra_key_columns, lookup_dict, result_count=1, report=None):
+        """对多个主表查找列分别查找同一个参考表索引，返回(结果列列表, 匹配数, 未找到数)
+
+        primary_columns为各查找列的数据，extra_key_columns为组合键其余键列的数据（各查找列共用）；
+        结果列按查找列顺序排列，每个查找列对应result_count列。
+        任一查找列有匹配的行在report中记为匹配行。
+        """
+        extra_keys = build_extra_keys(extra_key_columns, self.normalizer)
+        if isinstance(lookup_dict, MergeJoinSource):
+            try:
+                return self.merge_join_columns(primary_columns, extra_keys, lookup_dict, report)
+            except NotSortedError as e:
+                self.add_message(f"⚠️ {str(e)}，改用哈希查找")
+                source = lookup_dict
+                lookup_dict = source.fallback_index = self.prepare_index(self.load_reference(
+                    source.ref_path, source.search_column, source.result_column))
+
+        total_rows = len(primary_columns[0]) if primary_columns else 0
+        if self.workers > 1 and total_rows > self.chunk_size:
+            return self.parallel_lookup_columns(primary_columns, extra_keys, lookup_dict, result_count, report)
+
+        all_results = []
+        matched_count = 0
+        not_found_count = 0
+        for cell_values in primary_columns:
+            result_columns, matched, not_found = self.lookup_column(
+                cell_values, lookup_dict, extra_keys, result_count, report)
+            all_results.extend(result_columns)
+            matched_count += matched
+            not_found_count += not_found
+        return all_results, matched_count, not_found_count
+
+    def merge_join_columns(self, primary_columns, extra_keys, source, report=None):
+        """归并连接：每个查找列按键顺序流式扫描一遍参考表，返回(结果列列表, 匹配数, 未找到数)
+
+        任一列或参考表没有排序时抛出NotSortedError，report只在全部成功后才写入。
+        """
+        column_reports = []
+        all_results = []
+        matched_count = 0
+        not_found_count = 0
+        for cell_values in primary_columns:
+            column_report = LookupReport(len(cell_values), report.track_keys) if report is not None else None
+            result_columns, matched, not_found = merge_join_column(
+                source, cell_values, extra_keys, self.not_found_value, column_report, self.normalizer)
+            column_reports.append(column_report)
+            all_results.extend(result_columns)
+            matched_count += matched
+            not_found_count += not_found
+
+        if report is not None:
+            for column_report in column_reports:
+                report.merge(column_report)
+        self.add_message("🔀 归并连接完成，未构建参考表索引")
+        self.log_reference_summary(len(source), source.duplicate_keys)
+        return all_results, matched_count, not_found_count
+
+    def create_reference_source(self, ref_path, search_column, result_column):
+        """按选项返回查找字典或归并连接来源"""
+        if self.merge_join and not self.approximate and self.match_mode == "exact":
+            search_columns = as_column_list(search_column)
+            result_columns = as_column_list(result_column)
+            normalizer = self.normalizer
+            self.add_message("🔀 使用归并连接，按键顺序流式读取参考表")
+            return MergeJoinSource(
+                ref_path, search_column, result_column,
+                lambda: iter_reference_rows(ref_path, search_columns, result_columns, normalizer),
+                len(search_columns), len(result_columns), self.duplicate_policy)
+        return self.prepare_index(self.load_reference(ref_path, search_column, result_column))
+
+    def parallel_lookup_columns(self, primary_columns, extra_keys, lookup_dict, result_count=1, report=None):
+        """多进程并行查找，返回(结果列列表, 匹配数, 未找到数)
+
+        主表按chunk_size行分块，由workers个进程对同一只读索引查找，结果按原行顺序合并。
+        索引在进程启动时通过初始化函数传入，每个进程只接收一次。
+        """
+        total_rows = len(primary_columns[0])
+        chunk_size = max(1, self.chunk_size)
+        chunk_starts = range(0, total_rows, chunk_size)
+        track_keys = report.track_keys if report is not None else None
+        tasks = []
+        for cell_values in primary_columns:
+            for start in chunk_starts:
+                end = start + chunk_size
+                tasks.append((list(cell_values[start:end]), extra_keys[start:end] if extra_keys else None,
+                              result_count, track_keys))
+
+        self.add_message(f"🚀 多进程并行查找: {self.workers} 个进程, {len(tasks)} 个分块")
+        shared_index = self.shared_lookup_index(lookup_dict)
+        all_results = [[] for _ in range(len(primary_columns) * result_count)]
+        matched_count = 0
+        not_found_count = 0
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_lookup_worker,
+                                 initargs=(shared_index, self.not_found_value, self.vectorized,
+                                           self.key_normalization)) as executor:
+            # map按提交顺序返回结果，分块按(查找列, 起始行)顺序提交，直接拼接即可还原行顺序
+            for task_idx, (result_columns, matched, not_found, chunk_report) in enumerate(
+                    executor.map(lookup_chunk, tasks)):
+                column_offset = task_idx // len(chunk_starts) * result_count
+                for offset, column in enumerate(result_columns):
+                    all_results[column_offset + offset].extend(column)
+                if report is not None:
+                    report.merge(chunk_report, chunk_starts[task_idx % len(chunk_starts)])
+                matched_count += matched
+                not_found_count += not_found
+
+                done = task_idx + 1
+                if done % 10 == 0 or done == len(tasks):
+                    self.update_progress(30 + int(done / len(tasks) * 10), f"并行查找进度: {done}/{len(tasks)} 块")
+
+        return all_results, matched_count, not_found_count
+
+    def shared_lookup_index(self, lookup_dict):
+        """返回传给并行子进程的索引：普通查找字典写成内存映射文件，各进程共享同一份数据
+
+        其他索引（SQLite磁盘索引、区间索引）原样返回。同一参考表索引只写一次文件，
+        映射文件放在引擎临时目录中，替换或close时删除。
+        """
+        if type(lookup_dict) is not dict:
+            return lookup_dict
+        if self.shared_index is not None and self.shared_index_source is lookup_dict:
+            return self.shared_index
+
+        self.discard_index(self.shared_index)  # 上一份映射文件同时删除
+        self.shared_index = None
+        path = self.temp_index_path("lookup.mmap")
+        self.add_message("🗺️ 正在写入共享内存映射索引...")
+        self.shared_index = MmapLookupIndex.build(path, lookup_dict)
+        self.shared_index_source = lookup_dict
+        return self.shared_index
+
+    def run_hybrid(self, main_path, ref_path, lookup_column, search_column, result_column,
+                   output_path, insert_column="", extra_lookup_columns=None):
+        """混合模式：openpyxl在内存中完成数据查找和格式设置，只保存一次到output_path，返回统计信息
+
+        lookup_column和search_column可以是列名列表（组合键），两边按顺序一一对应，
+        第一列为主键列，支持换行多值拆分；result_column可以是多个列名，一次输出全部结果列。
+        extra_lookup_columns为主表中其他需要用同一参考表索引查找的列，每列输出各自的结果列。
+        """
+        start_time = time.time()
+        self.add_message("="*50)
+        self.add_message("🚀 开始执行快速VLOOKUP操作（混合模式）...")
+
+        try:
+            # 1. 使用openpyxl快速构建查找字典 (10%)
+            self.update_progress(10, "正在快速读取参考表数据...")
+            lookup_dict = self.create_reference_source(ref_path, search_column, result_column)
+
+            # 2. 使用openpyxl快速处理主表数据并设置格式 (40%)
+            self.update_progress(40, "正在快速处理主表数据...")
+            wb_main, stats = self.process_main_table_with_openpyxl(
+                main_path, lookup_column, result_column, lookup_dict, insert_column, extra_lookup_columns)
+
+            # 3. 直接保存结果文件，不经过临时文件 (80%)
+            self.update_progress(80, "正在保存结果文件...")
+            try:
+                wb_main.save(output_path)
+            finally:
+                wb_main.close()
+
+            # 4. 计算耗时 (100%)
+            elapsed_time = time.time() - start_time
+            stats["elapsed"] = elapsed_time
+            self.update_progress(100, f"快速处理完成！耗时 {elapsed_time:.2f}秒")
+            self.add_message(f"⚡ 快速处理完成！耗时 {elapsed_time:.2f}秒")
+            self.add_message(f"📁 结果文件: {os.path.basename(output_path)}")
+            self.add_message("="*50)
+            return stats
+
+        except Exception as e:
+            self.update_progress(0, f"快速处理失败: {str(e)}")
+            raise e
+
+    def run_xlwings(self, main_path, ref_path, lookup_column, search_column, result_column,
+                    output_path, insert_column="", extra_lookup_columns=None):
+        """标准模式：全程使用xlwings处理，返回统计信息"""
+        import xlwings as xw
+
+        app = xw.App(visible=False)
+        self.xl_app = app  # 保存引用以便关闭
+        try:
+            return self.run_with_backend(XlwingsBackend(app), main_path, ref_path, lookup_column, search_column,
+                                         result_column, output_path, insert_column, extra_lookup_columns)
+        finally:
+            app.quit()
+            self.xl_app = None
+
+    def run_with_backend(self, backend, main_path, ref_path, lookup_column, search_column, result_column,
+                         output_path, insert_column="", extra_lookup_columns=None):
+        """标准模式流程：通过工作簿后端按区域批量读写，返回统计信息"""
+        start_time = time.time()
+        self.add_message("="*50)
+        self.add_message("开始执行VLOOKUP操作...")
+
+        try:
+            # 1. 读取参考表数据 (20%)
+            self.update_progress(20, "正在读取参考表数据...")
+            if self.merge_join:
+                self.add_message("⚠️ 标准模式不支持归并连接，使用哈希查找")
+
+            def build_with_backend():
+                book_ref = backend.open(ref_path)
+                try:
+                    return self.build_lookup_dict(book_ref, search_column, result_column)
+                finally:
+                    book_ref.close()
+
+            lookup_dict = self.prepare_index(self.load_reference(
+                ref_path, search_column, result_column, builder=build_with_backend, source=type(backend).__name__))
+
+            # 2. 处理主表 (50%)
+            self.update_progress(50, "正在处理主表...")
+            book_main = backend.open(main_path)
+            try:
+                stats = self.process_main_table_fast(
+                    book_main, lookup_column, result_column, lookup_dict, insert_column, extra_lookup_columns)
+
+                # 3. 保存结果 (100%)
+                self.update_progress(100, f"正在保存到: {os.path.basename(output_path)}")
+                book_main.save(output_path)
+            finally:
+                book_main.close()
+
+            # 4. 计算耗时
+            elapsed_time = time.time() - start_time
+            stats["elapsed"] = elapsed_time
+            self.add_message(f"✅ 处理完成！耗时 {elapsed_time:.2f}秒")
+            self.add_message(f"📁 结果文件: {os.path.basename(output_path)}")
+            self.add_message("="*50)
+            return stats
+
+        except Exception as e:
+            self.update_progress(0, f"处理失败: {str(e)}")
+            raise e
+
+    def build_lookup_dict(self, book_ref, search_column, result_column):
+        """通过工作簿后端构建查找字典，所有需要的列一次读取（避免逐列往返）"""
+        # 读取表头
+        header = book_ref.read_header()
+        if not header:
+            raise ValueError("参考表没有表头")
+
+        search_columns = as_column_list(search_column)
+        result_columns = as_column_list(result_column)
+        try:
+            search_col_indexes = [header.index(column) + 1 for column in search_columns]
+            result_col_indexes = [header.index(column) + 1 for column in result_columns]
+        except ValueError as e:
+            raise ValueError(f"参考表中未找到指定列: {e}")
+
+        # 获取数据范围
+        last_row = book_ref.max_row()
+
+        # 一次性读取所有键列和结果列
+        column_data = book_ref.read_columns(search_col_indexes + result_col_indexes, last_row)
+        key_columns = column_data[:len(search_col_indexes)]
+        record_columns = column_data[len(search_col_indexes):]
+
+        # 组合键和结果记录在同一次遍历中生成，重复键的记录全部保留
+        builder = create_builder(self.duplicate_policy)
+        normalizer = self.normalizer
+        for key_values, result_values in zip(zip(*key_columns), zip(*record_columns)):
+            if key_values[0] is not None:
+                builder.add(make_lookup_key(key_values, normalizer), make_result_record(result_values))
+
+        return self.finish_reference_index(builder)
+
+    def process_main_table_fast(self, book_main, lookup_column, result_column, lookup_dict, insert_column="",
+                                extra_lookup_columns=None):
+        """通过工作簿后端处理主表数据，返回统计信息
+
+        查找列一次读取，结果列作为一个二维区域一次写入，标题和数据格式各设置一次，
+        与Excel的往返次数与行数无关。
+        """
+        # 读取表头
+        header_main = book_main.read_header()
+        if not header_main:
+            raise ValueError("主表没有表头")
+
+        lookup_columns = as_column_list(lookup_column)
+        primary_names = lookup_columns[:1] + as_column_list(extra_lookup_columns)
+        try:
+            primary_col_indexes = [header_main.index(column) + 1 for column in primary_names]
+            extra_key_indexes = [header_main.index(column) + 1 for column in lookup_columns[1:]]
+        except ValueError as e:
+            raise ValueError(f"主表中未找到列: {e}")
+
+        # 获取数据范围
+        last_row_main = book_main.max_row()
+
+        # 确定新列位置（结果列总是连续的）
+        result_columns = as_column_list(result_column)
+        new_col_indexes, new_col_names = resolve_result_columns(
+            header_main, result_columns, insert_column, primary_names)
+        first_col, last_col = new_col_indexes[0], new_col_indexes[-1]
+
+        self.add_message("🔄 正在处理多值查找...")
+
+        # 一次性读取所有查找列数据
+        column_data = book_main.read_columns(primary_col_indexes + extra_key_indexes, last_row_main)
+        primary_columns = column_data[:len(primary_col_indexes)]
+        extra_key_columns = column_data[len(primary_col_indexes):]
+
+        # 读取查找列之后再插入多出的结果列，插入列右侧原有的数据随之右移
+        inserted_count = inserted_result_columns(insert_column, new_col_indexes)
+        if inserted_count:
+            book_main.insert_columns(first_col + 1, inserted_count)
+
+        total_rows = len(primary_columns[0])
+        report = self.create_report(total_rows)
+        result_data, matched_count, not_found_count = self.lookup_main_columns(
+            primary_columns, extra_key_columns, lookup_dict, len(result_columns), report)
+
+        # 标题和结果作为一个二维区域一次写入
+        self.update_progress(75, f"正在写入 {total_rows} 行结果...")
+        book_main.write_range(1, first_col, [new_col_names] + [list(row) for row in zip(*result_data)])
+
+        kept_rows = total_rows
+        if self.join_mode != "left":
+            # 由下往上整段删除不保留的行，Excel中原有格式随行移动；往返次数与连续段数有关
+            keep = report.keep_mask(self.join_mode)
+            for first_row, last_row in reversed(dropped_row_runs(keep)):
+                book_main.delete_rows(first_row, last_row)
+            kept_rows = int(keep.sum())
+            self.add_message(f"🔗 连接方式: {JOIN_MODES[self.join_mode]}，保留 {kept_rows}/{total_rows} 行")
+
+        # 批量设置格式
+        self.add_message("🔄 正在设置格式...")
+        try:
+            book_main.style_range(1, first_col, 1, last_col, HEADER_STYLE)
+            if kept_rows > 0:
+                book_main.style_range(2, first_col, kept_rows + 1, last_col, DATA_STYLE)
+            self.add_message("✅ 格式设置完成")
+
+        except Exception as e:
+            self.add_message(f"⚠️ 格式设置部分失败，但数据已处理完成: {str(e)}")
+            # 继续执行，不中断整个流程
+
+        if self.write_report:
+            book_main.add_sheet(REPORT_SHEET_NAME, report.sheet_rows(lookup_dict))
+            self.add_message(f"📋 已生成{REPORT_SHEET_NAME}: 未匹配键 {len(report.missing_keys)} 个")
+
+        self.add_message(f"✅ 处理完成: 总行数 {total_rows}, 匹配成功 {matched_count}, 未找到 {not_found_count}")
+        return {
+            "total_rows": total_rows,
+            "kept_rows": kept_rows,
+            "matched": matched_count,
+            "not_found": not_found_count,
+            "result_headers": new_col_names,
+        }
+
+    def build_lookup_dict_with_openpyxl(self, ref_path, search_column, result_column):
+        """使用openpyxl流式构建查找字典（只读模式，只读取搜索列和结果列）
+
+        search_column可以是多个列名，此时以规范化后的元组作为组合键；
+        result_column可以是多个列名，此时索引值为各结果列组成的记录元组。
+        重复键按duplicate_policy处理，重复键汇总在同一次遍历中得到。
+        """
+        builder = create_builder(self.duplicate_policy)
+        search_columns = as_column_list(search_column)
+        result_columns = as_column_list(result_column)
+        key_count = len(search_columns)
+        normalizer = self.normalizer
+
+        # 逐行构建，峰值内存只取决于索引大小
+        for row in iter_sheet_columns(ref_path, search_columns + result_columns, "参考表"):
+            if row[0] is not None:
+                builder.add(make_lookup_key(row[:key_count], normalizer), make_result_record(row[key_count:]))
+
+        return self.finish_reference_index(builder)
+
+    def process_main_table_with_openpyxl(self, main_path, lookup_column, result_column, lookup_dict,
+                                         insert_column="", extra_lookup_columns=None):
+        """使用openpyxl快速处理主表数据，返回(结果工作簿, 统计信息)
+
+        所有查找列在一次遍历中读取，每个查找列的结果写入各自的结果列；
+        格式由format_result_columns在内存中设置，返回的工作簿可直接保存，全程不需要Excel。
+        连接方式不是left时原地压缩数据行，启用报告时追加“查找报告”工作表。
+        """
+        wb_main = load_workbook(main_path, data_only=True)
+        ws_main = wb_main.active
+
+        # 读取表头
+        header_main = [cell.value for cell in ws_main[1]]
+        if not header_main:
+            raise ValueError("主表没有表头")
+
+        lookup_columns = as_column_list(lookup_column)
+        primary_names = lookup_columns[:1] + as_column_list(extra_lookup_columns)
+        try:
+            primary_col_indexes = [header_main.index(column) + 1 for column in primary_names]
+            extra_key_indexes = [header_main.index(column) + 1 for column in lookup_columns[1:]]
+        except ValueError as e:
+            raise ValueError(f"主表中未找到列: {e}")
+
+        # 确定新列位置
+        result_columns = as_column_list(result_column)
+        new_col_indexes, new_col_names = resolve_result_columns(
+            header_main, result_columns, insert_column, primary_names)
+
+        # 先整列读取查找值，再整列查找
+        max_row = ws_main.max_row
+        total_rows = max_row - 1
+
+        self.add_message("🔄 正在处理数据...")
+        column_data = read_columns_openpyxl(ws_main, primary_col_indexes + extra_key_indexes, max_row)
+        primary_columns = column_data[:len(primary_col_indexes)]
+        extra_key_columns = column_data[len(primary_col_indexes):]
+
+        # 读取查找列之后再插入多出的结果列，插入列右侧原有的数据随之右移
+        inserted_count = inserted_result_columns(insert_column, new_col_indexes)
+        if inserted_count:
+            ws_main.insert_cols(new_col_indexes[0] + 1, inserted_count)
+
+        # 添加新列标题
+        for new_col_idx, new_col_name in zip(new_col_indexes, new_col_names):
+            ws_main.cell(row=1, column=new_col_idx).value = new_col_name
+        report = self.create_report(total_rows)
+        result_data, matched_count, not_found_count = self.lookup_main_columns(
+            primary_columns, extra_key_columns, lookup_dict, len(result_columns), report)
+
+        kept_rows = total_rows
+        if self.join_mode != "left":
+            # 先压缩原数据行，结果只写到保留的行
+            keep = report.keep_mask(self.join_mode).tolist()
+            kept_rows = compact_rows_openpyxl(ws_main, keep, len(header_main) + inserted_count)
+            result_data = [list(compress(column, keep)) for column in result_data]
+            self.add_message(f"🔗 连接方式: {JOIN_MODES[self.join_mode]}，保留 {kept_rows}/{total_rows} 行")
+
+        for row, row_results in enumerate(zip(*result_data), start=2):
+            for new_col_idx, final_result in zip(new_col_indexes, row_results):
+                ws_main.cell(row=row, column=new_col_idx).value = final_result
+
+            # 每100行更新一次进度
+            if (row - 1) % 100 == 0:
+                progress = int((row - 1) / kept_rows * 30) + 40  # 40-70%范围
+                self.update_progress(progress, f"数据处理进度: {row - 1}/{kept_rows} 行")
+
+        self.add_message(f"✅ 数据处理完成，共 {total_rows} 行数据")
+
+        # 在内存中设置格式，不需要启动Excel
+        self.update_progress(70, "正在设置Excel格式...")
+        format_result_columns(ws_main, new_col_indexes, kept_rows + 1)
+        self.add_message("✅ 格式设置完成")
+
+        if self.write_report:
+            ws_report = wb_main.create_sheet(REPORT_SHEET_NAME)
+            for report_row in report.sheet_rows(lookup_dict):
+                ws_report.append(report_row)
+            format_result_columns(ws_report, [1, 2, 4], 1)
+            self.add_message(f"📋 已生成{REPORT_SHEET_NAME}: 未匹配键 {len(report.missing_keys)} 个")
+
+        return wb_main, {
+            "total_rows": total_rows,
+            "kept_rows": kept_rows,
+            "matched": matched_count,
+            "not_found": not_found_count,
+            "result_headers": new_col_names,
+        }
+
+
+# 连接方式：保留全部行 / 只保留有匹配的行 / 只保留没有匹配的行
+JOIN_MODES = {
+    "left": "保留全部行",
+    "inner": "只保留匹配行",
+    "anti": "只保留未匹配行",
+}
+REPORT_SHEET_NAME = "查找报告"
+
+
+class LookupReport:
+    """在查找过程中顺带收集的统计：每行是否有匹配、未匹配键出现次数、命中过的参考表键
+
+    行的匹配状态按查找列取“或”：任一查找列的任一查找值匹配即视为匹配行，空单元格视为未匹配。
+    track_keys为False时只记录行状态（连接方式需要），不记录键。
+    """
+
+    def __init__(self, row_count, track_keys=True):
+        self.row_matched = np.zeros(row_count, dtype=bool)
+        self.track_keys = track_keys
+        self.missing_keys = Counter()  # 未匹配键 -> 出现次数
+        self.hit_keys = set()  # 命中过的查找键
+        self.unmatched_reference_keys = None  # 归并连接扫描时得到的未命中参考表键，其他查找方式为None
+
+    def add_rows(self, row_matched, offset=0):
+        """合并一段连续行的匹配状态"""
+        row_matched = np.asarray(row_matched, dtype=bool)
+        self.row_matched[offset:offset + len(row_matched)] |= row_matched
+
+    def add_key(self, key, found):
+        """记录单个查找键"""
+        if found:
+            self.hit_keys.add(key)
+        else:
+            self.missing_keys[key] += 1
+
+    def add_key_counts(self, keys, counts, found):
+        """批量记录去重后的查找键及其出现次数"""
+        for key, count, is_found in zip(keys, counts.tolist(), found.tolist()):
+            if is_found:
+                self.hit_keys.add(key)
+            else:
+                self.missing_keys[key] += count
+
+    def merge(self, other, offset=0):
+        """合并并行分块的报告，offset为分块首行在整表中的位置"""
+        self.add_rows(other.row_matched, offset)
+        self.missing_keys.update(other.missing_keys)
+        self.hit_keys |= other.hit_keys
+        if self.unmatched_reference_keys is None:
+            # 各查找列的未命中键再按全部命中键过滤，取第一列的即可
+            self.unmatched_reference_keys = other.unmatched_reference_keys
+
+    def keep_mask(self, join_mode):
+        """按连接方式返回需要保留的行"""
+        if join_mode not in JOIN_MODES:
+            raise ValueError(f"不支持的连接方式: {join_mode}")
+        if join_mode == "inner":
+            return self.row_matched
+        if join_mode == "anti":
+            return ~self.row_matched
+        return np.ones(len(self.row_matched), dtype=bool)
+
+    def unused_reference_keys(self, lookup_dict):
+        """参考表中从未被命中的键；索引不支持遍历键（如近似匹配）时返回None"""
+        if self.unmatched_reference_keys is not None:
+            return [key for key in self.unmatched_reference_keys if key not in self.hit_keys]
+        if getattr(lookup_dict, "fallback_index", None) is not None:
+            lookup_dict = lookup_dict.fallback_index  # 归并连接退回了哈希查找
+        if not hasattr(lookup_dict, "keys"):
+            return None
+        return [key for key in lookup_dict.keys() if key not in self.hit_keys]
+
+    def sheet_rows(self, lookup_dict):
+        """生成报告工作表内容：未匹配键及出现次数、参考表未命中键"""
+        missing = sorted(self.missing_keys.items(), key=lambda item: (-item[1], str(item[0])))
+        unused = self.unused_reference_keys(lookup_dict)
+        rows = [["未匹配键", "出现次数", "", "参考表未命中键"]]
+        if unused is None:
+            unused = ["（当前查找方式不统计）"]
+        for missing_item, unused_key in zip_longest(missing, unused):
+            row = ["", "", "", ""]
+            if missing_item is not None:
+                row[0], row[1] = format_report_key(missing_item[0]), missing_item[1]
+            if unused_key is not None:
+                row[3] = format_report_key(unused_key)
+            rows.append(row)
+        return rows
+
+
+def format_report_key(key):
+    """组合键在报告中用“ | ”连接显示"""
+    return " | ".join(key) if isinstance(key, tuple) else key
+
+
+def dropped_row_runs(keep):
+    """返回不保留的连续数据行段[(首行, 末行)]，行号为工作表行号（数据从第2行开始）"""
+    runs = []
+    start = None
+    for row, kept in enumerate(np.asarray(keep).tolist(), start=2):
+        if not kept and start is None:
+            start = row
+        elif kept and start is not None:
+            runs.append((start, row - 1))
+            start = None
+    if start is not None:
+        runs.append((start, len(keep) + 1))
+    return runs
+
+
+def compact_rows_openpyxl(ws, keep, max_col):
+    """原地压缩数据行：保留的行依次上移（连同单元格样式和行高），再一次删除末尾多余行
+
+    keep与第2行开始的数据行逐行对应，返回保留的行数。
+    """
+    target = 2
+    for source_row, kept in zip(ws.iter_rows(min_row=2, max_row=len(keep) + 1, max_col=max_col), keep):
+        if not kept:
+            continue
+        source = source_row[0].row
+        if source != target:
+            for cell in source_row:
+                target_cell = ws.cell(row=target, column=cell.column)
+                target_cell.value = cell.value
+                target_cell._style = copy(cell._style)
+            if source in ws.row_dimensions:
+                ws.row_dimensions[target].height = ws.row_dimensions[source].height
+        target += 1
+
+    if ws.max_row >= target:
+        ws.delete_rows(target, ws.max_row - target + 1)
+    return target - 2
+
+
+# 结果列共用的样式对象，所有单元格引用同一组样式，工作簿样式表中只各占一条
+HEADER_FONT = Font(bold=True, color="FFFFFF")  # 白色粗体
+HEADER_FILL = PatternFill(fill_type="solid", fgColor="4F81BD")  # 蓝色背景
+HEADER_ALIGNMENT = Alignment(horizontal='center')
+DATA_ALIGNMENT = Alignment(horizontal='center', vertical='center', wrap_text=True)
+RESULT_ROW_HEIGHT = 50  # 数据行固定行高（磅）
+
+
+def format_result_columns(ws, col_indexes, last_row):
+    """用openpyxl设置结果列格式：标题蓝底白字加粗居中，数据居中换行，数据行高50磅
+
+    行高通过行维度设置，每行只设置一次，与结果列数量无关。
+    """
+    for col_idx in col_indexes:
+        header_cell = ws.cell(row=1, column=col_idx)
+        header_cell.font = HEADER_FONT
+        header_cell.fill = HEADER_FILL
+        header_cell.alignment = HEADER_ALIGNMENT
+
+    if last_row < 2:
+        return
+
+    for col_idx in col_indexes:
+        for row in ws.iter_rows(min_row=2, max_row=last_row, min_col=col_idx, max_col=col_idx):
+            row[0].alignment = DATA_ALIGNMENT
+
+    for row_idx in range(2, last_row + 1):
+        ws.row_dimensions[row_idx].height = RESULT_ROW_HEIGHT
+
+
+# 并行查找子进程中的引擎实例，由init_lookup_worker在进程启动时创建
+_worker_engine = None
+
+
+def init_lookup_worker(lookup_dict, not_found_value, vectorized, key_normalization=()):
+    """进程池初始化函数：在子进程中保存只读索引"""
+    global _worker_engine
+    _worker_engine = VlookupEngine(not_found_value=not_found_value, vectorized=vectorized,
+                                   key_normalization=key_normalization)
+    _worker_engine.lookup_dict = lookup_dict
+
+
+def lookup_chunk(task):
+    """在子进程中查找一个分块，返回(结果列列表, 匹配数, 未找到数, 分块报告)
+
+    task为(查找值列表, 组合键其余部分列表, 结果列数, 是否记录查找键)，
+    最后一项为None时不生成报告。
+    """
+    cell_values, extra_keys, result_count, track_keys = task
+    report = LookupReport(len(cell_values), track_keys) if track_keys is not None else None
+    result_columns, matched, not_found = _worker_engine.lookup_column(
+        cell_values, _worker_engine.lookup_dict, extra_keys, result_count, report)
+    return result_columns, matched, not_found, report
+
+
+PLAIN_KEYS = KeyNormalizer()  # 只去除首尾空白的默认规范化
+
+
+def as_column_list(columns):
+    """把单个列名或列名列表统一为列表"""
+    if columns is None:
+        return []
+    if isinstance(columns, (list, tuple)):
+        return list(columns)
+    return [columns]
+
+
+def normalize_key_value(value, normalizer=None):
+    """规范化单个键值，未指定normalizer时只去除首尾空白"""
+    return (normalizer or PLAIN_KEYS).value(value)
+
+
+def make_lookup_key(values, normalizer=None):
+    """由一个或多个键列的值生成查找键：单列为字符串，多列为规范化字符串组成的元组"""
+    normalizer = normalizer or PLAIN_KEYS
+    if len(values) == 1:
+        return normalizer.value(values[0])
+    return tuple(normalizer.value(v) for v in values)
+
+
+def make_result_record(values):
+    """由一个或多个结果列的值生成索引记录：单列为字符串，多列为字符串元组"""
+    if len(values) == 1:
+        return "" if values[0] is None else str(values[0]).strip()
+    return tuple("" if v is None else str(v).strip() for v in values)
+
+
+def resolve_result_columns(header, result_columns, insert_column="", lookup_names=None):
+    """确定结果列的位置和标题，返回(列号列表, 标题列表)
+
+    指定插入列时第一个结果写入该列，其余结果列插入在它之后（见inserted_result_columns），
+    否则追加到最后一列之后；
+    有多个主表查找列时，每个查找列各占一组结果列，标题中带上查找列名。
+    """
+    if insert_column:  # 如果选择了特定列
+        try:
+            first_col_idx = header.index(insert_column) + 1
+        except ValueError:
+            raise ValueError(f"主表中未找到列: {insert_column}")
+    else:  # 追加到最后一列
+        first_col_idx = len([h for h in header if h is not None]) + 1
+
+    lookup_names = lookup_names or []
+    if len(lookup_names) > 1:
+        col_names = [f"查找结果_{lookup}_{column}" for lookup in lookup_names for column in result_columns]
+    else:
+        col_names = [f"查找结果_{column}" for column in result_columns]
+    col_indexes = [first_col_idx + offset for offset in range(len(col_names))]
+    return col_indexes, col_names
+
+
+def inserted_result_columns(insert_column, col_indexes):
+    """写入结果前需要在插入列之后新插入的列数
+
+    只有第一个结果列覆盖所选的插入列，其余结果列插入为新列，不覆盖右侧原有的数据。
+    """
+    return len(col_indexes) - 1 if insert_column else 0
+
+
+def read_columns_openpyxl(ws, col_indexes, max_row):
+    """一次遍历读取openpyxl工作表的多列数据（从第2行开始），返回每列一个列表"""
+    if not col_indexes:
+        return []
+    min_col = min(col_indexes)
+    offsets = [idx - min_col for idx in col_indexes]
+    columns = [[] for _ in col_indexes]
+    for row in ws.iter_rows(min_row=2, max_row=max_row, min_col=min_col, max_col=max(col_indexes),
+                            values_only=True):
+        for column, offset in zip(columns, offsets):
+            column.append(row[offset])
+    return columns
+
+
+def build_extra_keys(extra_columns, normalizer=None):
+    """由组合键的其余键列生成每行的规范化元组，单列键时返回None"""
+    if not extra_columns:
+        return None
+    return [tuple(normalize_key_value(v, normalizer) for v in values) for values in zip(*extra_columns)]
+
+
+def vectorized_lookup(cell_values, lookup_dict, not_found_value="-", extra_keys=None, result_count=1,
+                      report=None, normalizer=None):
+    """整列向量化多值查找，语义与VlookupEngine.lookup_cell逐行查找一致
+
+    先把所有单元格按换行符一次性拆分展开成查找值，去重后对参考表做一次哈希连接，
+    再按原行号用numpy偏移量重新聚合；只有多值单元格需要逐个拼接。
+    返回(结果列列表, 匹配数, 未找到数)。
+    """
+    row_count = len(cell_values)
+    if row_count == 0:
+        return [[] for _ in range(result_count)], 0, 0
+
+    # 1. 展开：整列拼接后一次拆分，记录每行的查找值个数
+    str_values = ["" if v is None else (v if isinstance(v, str) else str(v)) for v in cell_values]
+    token_counts = np.array([v.count('\n') for v in str_values], dtype=np.int64) + 1
+    tokens = np.array(list(map(str.strip, '\n'.join(str_values).split('\n'))), dtype=object)
+    keep = tokens != ""
+    token_rows = np.repeat(np.arange(row_count), token_counts)[keep]
+
+    # 2. 连接：重复的查找值只查一次；组合键时与所在行的其余键列拼成元组
+    tokens = tokens[keep]
+    if normalizer is not None and normalizer.modes:
+        # 重复的查找值只规范化一次
+        token_codes, token_uniques = pd.factorize(tokens)
+        normalized = np.empty(len(token_uniques), dtype=object)
+        normalized[:] = [normalizer(token) for token in token_uniques]
+        tokens = normalized[token_codes]
+    if extra_keys:
+        keyed = np.empty(len(tokens), dtype=object)
+        keyed[:] = [(token,) + extra_keys[row] for token, row in zip(tokens.tolist(), token_rows.tolist())]
+        tokens = keyed
+    codes, uniques = pd.factorize(tokens)
+    get_many = getattr(lookup_dict, "get_many", None)  # 区间索引等支持批量查找的索引
+    unique_records = get_many(list(uniques)) if get_many else list(map(lookup_dict.get, uniques))
+
+    if result_count == 1:
+        # 单结果列时索引值就是结果文本，空值视为未找到
+        unique_columns = [unique_records]
+        unique_found = np.array([r is not None and r != "" for r in unique_records], dtype=bool)
+    else:
+        unique_columns = [[r[i] if r is not None else "" for r in unique_records] for i in range(result_count)]
+        unique_found = np.array([r is not None for r in unique_records], dtype=bool)
+
+    token_found = unique_found[codes]
+    matched_count = int(token_found.sum())
+    not_found_count = len(codes) - matched_count
+
+    if report is not None:
+        # 去重后的查找值直接给出各键出现次数和是否命中，不需要再次遍历
+        report.add_rows(np.bincount(token_rows, weights=token_found, minlength=row_count) > 0)
+        if report.track_keys:
+            report.add_key_counts(uniques, np.bincount(codes, minlength=len(uniques)), unique_found)
+
+    # 3. 聚合：单值行直接取值，多值行用换行符合并
+    per_row = np.bincount(token_rows, minlength=row_count)
+    ends = np.cumsum(per_row)
+    starts = ends - per_row
+    single = per_row == 1
+    multi = np.flatnonzero(per_row > 1)
+    multi_bounds = list(zip(starts[multi].tolist(), ends[multi].tolist()))
+
+    result_columns = []
+    for unique_values in unique_columns:
+        values = np.empty(len(unique_values), dtype=object)
+        values[:] = unique_values
+        values[pd.isna(values) | (values == "")] = not_found_value
+        results = values[codes]
+
+        final_results = np.full(row_count, "", dtype=object)
+        final_results[single] = results[starts[single]]
+        if len(multi):
+            result_list = results.tolist()
+            final_results[multi] = ['\n'.join(result_list[start:end]) for start, end in multi_bounds]
+        result_columns.append(final_results.tolist())
+
+    return result_columns, matched_count, not_found_count
+
+
+def iter_reference_rows(ref_path, search_columns, result_columns, normalizer=None):
+    """流式读取参考表，逐行返回规范化后的(键列..., 结果列...)，跳过主键为空的行"""
+    key_count = len(search_columns)
+    for row in iter_sheet_columns(ref_path, search_columns + result_columns, "参考表"):
+        if row[0] is not None:
+            yield (tuple(normalize_key_value(v, normalizer) for v in row[:key_count])
+                   + tuple("" if v is None else str(v).strip() for v in row[key_count:]))
+
+
+DIMENSION_REF = re.compile(rb'<(?:\w+:)?dimension\s+ref="[A-Z]*(\d+)(?::[A-Z]*(\d+))?"')
+DIMENSION_SCAN_BYTES = 65536  # <dimension>位于工作表XML开头，只读取这么多字节
+
+
+def active_sheet_part(archive):
+    """返回xlsx压缩包中活动工作表的XML路径，只解析工作簿目录和关系文件"""
+    root_rels = ET.fromstring(archive.read("_rels/.rels"))
+    workbook_part = next(rel.get("Target") for rel in root_rels
+                         if rel.get("Type", "").endswith("/officeDocument")).lstrip("/")
+    workbook_dir, workbook_name = posixpath.split(workbook_part)
+    workbook = ET.fromstring(archive.read(workbook_part))
+    view = workbook.find("{*}bookViews/{*}workbookView")
+    active = int(view.get("activeTab", 0)) if view is not None else 0
+    sheet = workbook.findall("{*}sheets/{*}sheet")[active]
+    rel_id = next(value for name, value in sheet.attrib.items() if name.endswith("}id"))
+    rels = ET.fromstring(archive.read(posixpath.join(workbook_dir, "_rels", workbook_name + ".rels")))
+    target = next(rel.get("Target") for rel in rels if rel.get("Id") == rel_id)
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(workbook_dir, target))
+
+
+def count_sheet_rows(file_path):
+    """读取活动工作表<dimension>记录的数据行数（不含表头），不遍历数据、不加载共享字符串
+
+    直接从压缩包中读取工作表XML的开头；缺少尺寸信息时按文件大小粗略估计。
+    """
+    max_row = None
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            with archive.open(active_sheet_part(archive)) as sheet:
+                match = DIMENSION_REF.search(sheet.read(DIMENSION_SCAN_BYTES))
+        if match:
+            max_row = int(match.group(2) or match.group(1))
+    except (OSError, KeyError, IndexError, StopIteration, ValueError, zipfile.BadZipFile, ET.ParseError):
+        pass
+    if max_row is None:
+        return os.path.getsize(file_path) // 16  # 压缩后每行约十几个字节
+    return max(0, max_row - 1)
+
+
+def iter_sheet_columns(file_path, column_names, table_name="参考表"):
+    """以只读模式流式读取工作表的指定列，逐行返回各列值组成的元组
+
+    只解析表头和所需列所在的区间，不构建完整的单元格对象模型。
+    """
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+
+        # 读取表头
+        header = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), None)
+        if not header:
+            raise ValueError(f"{table_name}没有表头")
+        header = list(header)
+
+        try:
+            col_indexes = [header.index(name) for name in column_names]
+        except ValueError as e:
+            raise ValueError(f"{table_name}中未找到指定列: {e}")
+
+        # 只遍历包含所需列的最小列区间
+        min_col = min(col_indexes) + 1
+        max_col = max(col_indexes) + 1
+        offsets = [idx + 1 - min_col for idx in col_indexes]
+
+        for row in ws.iter_rows(min_row=2, min_col=min_col, max_col=max_col, values_only=True):
+            yield tuple(row[offset] if offset < len(row) else None for offset in offsets)
+    finally:
+        wb.close()